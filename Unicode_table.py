@@ -1,6 +1,42 @@
 #! /usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import unicodedata
+
+from profiler import stage
+
+# box drawing characters without dotted lines, in the (r, b, l, t) order:
+# (0, 0, 0, 0), (0, 0, 0, 1), (0, 0, 0, 2), (0, 0, 1, 0)... (2, 2, 2, 2)
+SOLID_GLYPHS = (
+    "\u0020\u2575\u2579\u2574\u2518\u251a\u2578\u2519\u251b"  # r = 0, b = 0
+    "\u2577\u2502\u257f\u2510\u2524\u2526\u2511\u2525\u2529"  # r = 0, b = 1
+    "\u257b\u257d\u2503\u2512\u2527\u2528\u2513\u252a\u252b"  # r = 0, b = 2
+    "\u2576\u2514\u2516\u2500\u2534\u2538\u257e\u2535\u2539"  # r = 1, b = 0
+    "\u250c\u251c\u251e\u252c\u253c\u2540\u252d\u253d\u2543"  # r = 1, b = 1
+    "\u250e\u251f\u2520\u2530\u2541\u2542\u2531\u2545\u2549"  # r = 1, b = 2
+    "\u257a\u2515\u2517\u257c\u2536\u253a\u2501\u2537\u253b"  # r = 2, b = 0
+    "\u250d\u251d\u2521\u252e\u253e\u2544\u252f\u253f\u2547"  # r = 2, b = 1
+    "\u250f\u2522\u2523\u2532\u2546\u254a\u2533\u2548\u254b"  # r = 2, b = 2
+    )
+# straight lines, with 0 to 3 interruptions
+DOTTED_GLYPHS = {
+    (0, 1, 0, 1): "\u2502\u254e\u2506\u250a",
+    (0, 2, 0, 2): "\u2503\u254f\u2507\u250b",
+    (1, 0, 1, 0): "\u2500\u254c\u2504\u2508",
+    (2, 0, 2, 0): "\u2501\u254d\u2505\u2509",
+    }
+# (r, b, l, t, dotted) -> box drawing character, for every valid input of
+# legs_to_unicode. Computed once, as it is used for every border character
+GLYPHS = {}
+for i, glyph in enumerate(SOLID_GLYPHS):
+    legs = (i // 27, i // 9 % 3, i // 3 % 3, i % 3)
+    for dotted in range(4):
+        if legs in DOTTED_GLYPHS:
+            GLYPHS[legs + (dotted,)] = DOTTED_GLYPHS[legs][dotted]
+        else:
+            GLYPHS[legs + (dotted,)] = glyph
+del i, glyph, legs, dotted
+
 def legs_to_unicode(r, b, l, t, dotted=0):
     """
     Return a box drawing Unicode character
@@ -11,259 +47,84 @@ def legs_to_unicode(r, b, l, t, dotted=0):
      ┼ corresponds to (1, 1, 1, 1) and ┫ to (0, 2, 2, 2).
     The last parameter allows to draw dotted horizontal or vertical lines. It
     is then the number of interruptions in the drawing, up to 3.
+    Return None if there is no such character
     """
-    if r == 0:
-        if b == 0:
-            if l == 0:
-                if t == 0:
-                    return "\u0020"
-                if t == 1:
-                    return "\u2575"
-                if t == 2:
-                    return "\u2579"
-            if l == 1:
-                if t == 0:
-                    return "\u2574"
-                if t == 1:
-                    return "\u2518"
-                if t == 2:
-                    return "\u251a"
-            if l == 2:
-                if t == 0:
-                    return "\u2578"
-                if t == 1:
-                    return "\u2519"
-                if t == 2:
-                    return "\u251b"
-        if b == 1:
-            if l == 0:
-                if t == 0:
-                    return "\u2577"
-                if t == 1:
-                    if dotted == 0:
-                        return "\u2502"
-                    if dotted == 1:
-                        return "\u254e"
-                    if dotted == 2:
-                        return "\u2506"
-                    if dotted == 3:
-                        return "\u250a"
-                if t == 2:
-                    return "\u257f"
-            if l == 1:
-                if t == 0:
-                    return "\u2510"
-                if t == 1:
-                    return "\u2524"
-                if t == 2:
-                    return "\u2526"
-            if l == 2:
-                if t == 0:
-                    return "\u2511"
-                if t == 1:
-                    return "\u2525"
-                if t == 2:
-                    return "\u2529"
-        if b == 2:
-            if l == 0:
-                if t == 0:
-                    return "\u257b"
-                if t == 1:
-                    return "\u257d"
-                if t == 2:
-                    if dotted == 0:
-                        return "\u2503"
-                    if dotted == 1:
-                        return "\u254f"
-                    if dotted == 2:
-                        return "\u2507"
-                    if dotted == 3:
-                        return "\u250b"
-            if l == 1:
-                if t == 0:
-                    return "\u2512"
-                if t == 1:
-                    return "\u2527"
-                if t == 2:
-                    return "\u2528"
-            if l == 2:
-                if t == 0:
-                    return "\u2513"
-                if t == 1:
-                    return "\u252a"
-                if t == 2:
-                    return "\u252b"
-    if r == 1:
-        if b == 0:
-            if l == 0:
-                if t == 0:
-                    return "\u2576"
-                if t == 1:
-                    return "\u2514"
-                if t == 2:
-                    return "\u2516"
-            if l == 1:
-                if t == 0:
-                    if dotted == 0:
-                        return "\u2500"
-                    if dotted == 1:
-                        return "\u254c"
-                    if dotted == 2:
-                        return "\u2504"
-                    if dotted == 3:
-                        return "\u2508"
-                if t == 1:
-                    return "\u2534"
-                if t == 2:
-                    return "\u2538"
-            if l == 2:
-                if t == 0:
-                    return "\u257e"
-                if t == 1:
-                    return "\u2535"
-                if t == 2:
-                    return "\u2539"
-        if b == 1:
-            if l == 0:
-                if t == 0:
-                    return "\u250c"
-                if t == 1:
-                    return "\u251c"
-                if t == 2:
-                    return "\u251e"
-            if l == 1:
-                if t == 0:
-                    return "\u252c"
-                if t == 1:
-                    return "\u253c"
-                if t == 2:
-                    return "\u2540"
-            if l == 2:
-                if t == 0:
-                    return "\u252d"
-                if t == 1:
-                    return "\u253d"
-                if t == 2:
-                    return "\u2543"
-        if b == 2:
-            if l == 0:
-                if t == 0:
-                    return "\u250e"
-                if t == 1:
-                    return "\u251f"
-                if t == 2:
-                    return "\u2520"
-            if l == 1:
-                if t == 0:
-                    return "\u2530"
-                if t == 1:
-                    return "\u2541"
-                if t == 2:
-                    return "\u2542"
-            if l == 2:
-                if t == 0:
-                    return "\u2531"
-                if t == 1:
-                    return "\u2545"
-                if t == 2:
-                    return "\u2549"
-    if r == 2:
-        if b == 0:
-            if l == 0:
-                if t == 0:
-                    return "\u257a"
-                if t == 1:
-                    return "\u2515"
-                if t == 2:
-                    return "\u2517"
-            if l == 1:
-                if t == 0:
-                    return "\u257c"
-                if t == 1:
-                    return "\u2536"
-                if t == 2:
-                    return "\u253a"
-            if l == 2:
-                if t == 0:
-                    if dotted == 0:
-                        return "\u2501"
-                    if dotted == 1:
-                        return "\u254d"
-                    if dotted == 2:
-                        return "\u2505"
-                    if dotted == 3:
-                        return "\u2509"
-                if t == 1:
-                    return "\u2537"
-                if t == 2:
-                    return "\u253b"
-        if b == 1:
-            if l == 0:
-                if t == 0:
-                    return "\u250d"
-                if t == 1:
-                    return "\u251d"
-                if t == 2:
-                    return "\u2521"
-            if l == 1:
-                if t == 0:
-                    return "\u252e"
-                if t == 1:
-                    return "\u253e"
-                if t == 2:
-                    return "\u2544"
-            if l == 2:
-                if t == 0:
-                    return "\u252f"
-                if t == 1:
-                    return "\u253f"
-                if t == 2:
-                    return "\u2547"
-        if b == 2:
-            if l == 0:
-                if t == 0:
-                    return "\u250f"
-                if t == 1:
-                    return "\u2522"
-                if t == 2:
-                    return "\u2523"
-            if l == 1:
-                if t == 0:
-                    return "\u2532"
-                if t == 1:
-                    return "\u2546"
-                if t == 2:
-                    return "\u254a"
-            if l == 2:
-                if t == 0:
-                    return "\u2533"
-                if t == 1:
-                    return "\u2548"
-                if t == 2:
-                    return "\u254b"
+    try:
+        return GLYPHS[r, b, l, t, dotted]
+    except KeyError:
+        # dotted is ignored by the characters that can't be dotted
+        if (r, b, l, t) in DOTTED_GLYPHS:
+            return None
+        return GLYPHS.get((r, b, l, t, 0))
 # end
 
-def make_table(data, v_lines, h_lines, min_width=3, min_height=1):
+# display width of the characters, by blocks of 256 code points. A block is
+# computed the first time one of its characters is measured
+BLOCK_WIDTHS = {}
+# display width of the non-ASCII strings already measured, and the number of
+# strings kept before forgetting them
+STRING_WIDTHS = {}
+MEMO_SIZE = 65536
+
+def block_widths(block):
     """
-    Make a table using the unicoge box drawing characters
-    
-    data is a rectangular list of lists. Its elements can be anything with a
-     str representation, and can include line breaks ("\n")
-    v_lines and h_lines are strings corresponding to the box formatting.
-     For example, "2101" means the first separator is bold (2), the second one
-     thin (1), there is no third separator and the last one is thin. It has to
-     match the size of data
-    min_width and min_height are the minimal width and height of cells
+    Return the display width of the 256 characters of a block, as bytes
     """
-    #Nested list manipulation
-    def flatten(nlist):
-        return [y for x in nlist for y in x]
-    def transpose(nlist):
-        h = len(nlist)
-        w = len(nlist[0])
-        return [[nlist[i][j] for i in range(h)] for j in range(w)]
-    # end
+    widths = bytearray(256)
+    for i in range(256):
+        char = chr(block << 8 | i)
+        if unicodedata.category(char) in ("Mn", "Me", "Cf", "Cc", "Cs") \
+                or 0x1160 <= ord(char) <= 0x11ff:
+            # combining marks, format characters (zero width joiner,
+             # variation selectors...) and medial Hangul Jamo
+            widths[i] = 0
+        elif unicodedata.east_asian_width(char) in ("W", "F"):
+            widths[i] = 2
+        else:
+            widths[i] = 1
+    return bytes(widths)
+# end
+
+def char_width(char):
+    """
+    Return the number of columns taken by a character on a monospace display
+
+    Wide and fullwidth East Asian characters, including most emoji, take 2
+     columns. Combining marks, format and control characters take none.
+     Ambiguous characters take a single one, as outside of East Asia
+    """
+    code = ord(char)
+    widths = BLOCK_WIDTHS.get(code >> 8)
+    if widths is None:
+        widths = BLOCK_WIDTHS[code >> 8] = block_widths(code >> 8)
+    return widths[code & 0xff]
+# end
+
+def display_width(text):
+    """
+    Return the number of columns taken by a string on a monospace display
+
+    See char_width. ASCII strings are measured by their length, the others
+     are remembered
+    """
+    if text.isascii():
+        return len(text)
+    width = STRING_WIDTHS.get(text)
+    if width is None:
+        if len(STRING_WIDTHS) >= MEMO_SIZE:
+            STRING_WIDTHS.clear()
+        width = STRING_WIDTHS[text] = sum(map(char_width, text))
+    return width
+# end
 
+def iter_table(data, v_lines, h_lines, min_width=3, min_height=1,
+               widths=None):
+    """
+    Yield the lines of a table made by make_table, one at a time
+
+    The parameters are the ones of make_table. The work done is linear in the
+     size of the table, and the separator lines are only built once
+    """
     def make_sep_line(thickness, format, position):
         # thickness is the line thickness
         # format is a string like "20010002" telling where to put vertical
@@ -290,32 +151,7 @@ def make_table(data, v_lines, h_lines, min_width=3, min_height=1):
             args[0][2] = 0
         if format[-1] != "0":
             args[-1][0] = 0
-        return "".join([legs_to_unicode(*elem) for elem in args])
-    # end
-
-    def make_fill_line(format, l_strings):
-        # format is a string like "20010002" telling where to put vertical
-         # lines. In that example:
-         # -the first separator is thick (starts with a "2")
-         # -the first column is 2 character wide (the two following zeroes)
-         # -the second separator is thin (the following character is "1"
-         # -the second column is 3 characters wide
-         # -the last separator is thick
-        # l_strings is the list of strings that will be used to fill the
-         # table line. Their length must match the number of zeroes in format
-        res = ""
-        while True:
-            try:
-                if format[0] == "0":
-                    fill = l_strings.pop(0)
-                    assert format[:len(fill)] == len(fill)*"0"
-                    res += fill
-                    format = format[len(fill):]
-                else:
-                    t, format = int(format[0]), format[1:]
-                    res += legs_to_unicode(0, t, 0, t)
-            except IndexError:
-                return res
+        return "".join([GLYPHS[r, b, l, t, 0] for r, b, l, t in args])
     # end
 
     # assert the data table is rectangular and that the specified formats are
@@ -327,67 +163,177 @@ def make_table(data, v_lines, h_lines, min_width=3, min_height=1):
     for line in data:
         assert len(line) == n_columns
 
-    # compute cell sizes
+    # compute cell sizes. str is called once per cell, and the line breaks
+    # split the cells in several lines
+    cells = [[str(elem).split("\n") for elem in line] for line in data]
     # height of a given row
-    heights = [max([str(data[i][j]).count("\n")+1 for j in range(n_columns)]
-                   + [min_height])
-               for i in range(n_rows)]
-    # if there are line breaks in the cells, create corresponding additional
-    # lines. exp is for expanded
-    def split_enough_lines(elem, n):
-        res = str(elem).split("\n")
-        while len(res) < n:
-            res.append("")
-        return res
-    # transpose([split_enough_lines]) is a list of rows corresponding to a
-    # single table row. [transpose([split_enough_lines])] is a list of list
-    # of rows and has to be flattened
-    data_exp = flatten([transpose([split_enough_lines(data[i][j], heights[i])
-                                   for j in range(n_columns)])
-                        for i in range(n_rows)])
-    # actual number of rows
-    n_exp_rows = len(data_exp)
-    # compute cell widths
-    widths = [max([len(str(data_exp[i][j])) for i in range(n_exp_rows)]
-                  + [min_width])
-              for j in range(n_columns)]
-    # list of lines, each of them being a list of strings with the right size
-    lines = [[data_exp[i][j].rjust(widths[j])
-              for j in range(n_columns)]
-             for i in range(n_exp_rows)]
+    heights = [max([len(cell) for cell in line] + [min_height])
+               for line in cells]
+    # width of a given column
+    if widths is None:
+        widths = column_widths(data, min_width)
 
     # compute formats
-    # h_format is a string used by make_sep_line and make_fill_line. 2 means
-    # thick line, 1 thin line, 0 absence of line (used by the table data)
-    h_format = ""
-    for sep, w in zip(v_lines, widths + [0]):
-        if sep != "0":
-            h_format += sep
-        h_format += w*"0"
-    # v_format is a string telling what is the purpose of each line. 2 means
-    # thick line, 1 thin line, 0 absence of line (used by the table data)
-    v_format = ""
-    for sep, w in zip(h_lines, heights + [0]):
-        if sep != "0":
-            v_format += sep
-        v_format += w*"0"
+    # h_format is a string used by make_sep_line. 2 means thick line, 1 thin
+    # line, 0 absence of line (used by the table data)
+    h_format = "".join([(sep if sep != "0" else "") + w*"0"
+                        for sep, w in zip(v_lines, widths + [0])])
+    # vertical separators of the fill lines, before each column and after the
+    # last one
+    v_seps = [GLYPHS[0, int(sep), 0, int(sep), 0] if sep != "0" else ""
+              for sep in v_lines]
+    # separator lines are identical for a given thickness and position, so
+    # they are only built once
+    sep_lines = {}
+    def sep_line(sep, pos):
+        if (sep, pos) not in sep_lines:
+            sep_lines[sep, pos] = make_sep_line(int(sep), h_format, pos)
+        return sep_lines[sep, pos]
 
-    # prepare the resulting string
-    result = []
-    for i, lt in enumerate(v_format):
-        if lt != "0":
+    # yield the lines. A separator is "top" if it's the first line of the
+    # table and "bottom" if it's the last one
+    for i in range(n_rows + 1):
+        sep = h_lines[i]
+        if sep != "0":
             if i == 0:
-                pos = "top"
-            elif i == len(v_format) - 1:
-                pos = "bottom"
+                yield sep_line(sep, "top")
+            elif i == n_rows:
+                yield sep_line(sep, "bottom")
             else:
-                pos = "mid"
-            result.append(make_sep_line(int(lt), h_format, pos))
-        else:
-            fill = lines.pop(0)
-            result.append(make_fill_line(h_format, fill))
+                yield sep_line(sep, "mid")
+        if i == n_rows:
+            break
+        line = cells[i]
+        # rjust counts characters, not columns: the cells of rows with
+        # non-ASCII characters are padded according to their display width
+        wide = not "".join(map("".join, line)).isascii()
+        for k in range(heights[i]):
+            fill = [v_seps[0]]
+            if wide:
+                for cell, w, v_sep in zip(line, widths, v_seps[1:]):
+                    s = cell[k] if k < len(cell) else ""
+                    fill.append(s.rjust(w + len(s) - display_width(s)))
+                    fill.append(v_sep)
+            else:
+                for cell, w, v_sep in zip(line, widths, v_seps[1:]):
+                    fill.append((cell[k] if k < len(cell) else "").rjust(w))
+                    fill.append(v_sep)
+            yield "".join(fill)
+# end
+
+def make_table(data, v_lines, h_lines, min_width=3, min_height=1,
+               widths=None):
+    """
+    Make a table using the unicoge box drawing characters
+    
+    data is a rectangular list of lists. Its elements can be anything with a
+     str representation, and can include line breaks ("\n")
+    v_lines and h_lines are strings corresponding to the box formatting.
+     For example, "2101" means the first separator is bold (2), the second one
+     thin (1), there is no third separator and the last one is thin. It has to
+     match the size of data
+    min_width and min_height are the minimal width and height of cells
+    widths can force the width of the columns, for example to draw several
+     parts of a table with the same layout. See column_widths
+    """
+    with stage("make_table", len(data)):
+        return "\n".join(iter_table(data, v_lines, h_lines, min_width,
+                                    min_height, widths))
+# end
+
+def write_table(stream, data, v_lines, h_lines, min_width=3, min_height=1,
+                widths=None):
+    """
+    Write a table made by make_table to a text stream, line by line
+
+    Unlike make_table, the whole table is never held in a single string
+    """
+    for i, line in enumerate(iter_table(data, v_lines, h_lines,
+                                        min_width, min_height, widths)):
+        if i:
+            stream.write("\n")
+        stream.write(line)
+# end
+
+def column_widths(data, min_width=3):
+    """
+    Return the width of the columns of a table made by make_table
+
+    Widths are display widths, see display_width
+    """
+    widths = [min_width] * len(data[0])
+    for line in data:
+        for j, elem in enumerate(line):
+            for s in str(elem).split("\n"):
+                w = len(s) if s.isascii() else display_width(s)
+                if w > widths[j]:
+                    widths[j] = w
+    return widths
+# end
+
+def paginate_table(data, v_lines, h_lines, max_chars, header_rows=1,
+                   min_width=3, min_height=1):
+    """
+    Split a table made by make_table in pages of at most max_chars characters
+
+    Each page is a table with the first header_rows rows of data, followed by
+     a group of the other rows, and the same column widths as the whole table.
+    The size of the pages is computed from the size of the cells, without
+     drawing anything. Return the number of pages and a generator drawing
+     each page only when it is reached.
+    Raise ValueError if the header and a single row don't fit in max_chars
+    """
+    n_rows = len(data)
+    assert len(h_lines) == n_rows + 1
+    widths = column_widths(data, min_width)
+    # every line of the table has the same width, newline included
+    line_size = sum(widths) + len([sep for sep in v_lines if sep != "0"]) + 1
+    heights = [max([str(elem).count("\n") + 1 for elem in line]
+                   + [min_height])
+               for line in data]
+    # pages are limited in characters: wide characters take a single one,
+    # and combining marks one more, so the rows with such characters are
+    # shorter or longer than their width
+    def extra_chars(line):
+        extra = 0
+        for elem in line:
+            elem = str(elem)
+            if not elem.isascii():
+                extra += sum(len(s) - display_width(s)
+                             for s in elem.split("\n"))
+        return extra
+    extras = [extra_chars(line) for line in data]
+    # characters repeated on each page: header rows, separators above and
+    # below them, and the bottom line
+    fixed = ((sum(heights[:header_rows])
+              + len([sep for sep in h_lines[:header_rows+1] if sep != "0"])
+              + (h_lines[-1] != "0")) * line_size
+             + sum(extras[:header_rows]))
+    # group the other rows. A page holds rows first to last - 1
+    bounds = []
+    first, size = header_rows, fixed
+    for i in range(header_rows, n_rows):
+        row_size = ((heights[i] + (i > first and h_lines[i] != "0"))
+                    * line_size + extras[i])
+        if i > first and size + row_size - 1 > max_chars:
+            bounds.append((first, i))
+            first, size = i, fixed
+            row_size = heights[i] * line_size + extras[i]
+        size += row_size
+        if size - 1 > max_chars:
+            raise ValueError("The table can't fit in {} characters".format(
+                max_chars))
+    if first < n_rows or not bounds:
+        bounds.append((first, n_rows))
 
-    return "\n".join(result)
+    def pages():
+        for first, last in bounds:
+            yield make_table(
+                data[:header_rows] + data[first:last], v_lines,
+                h_lines[:header_rows+1] + h_lines[first+1:last]
+                + h_lines[-1:],
+                min_width, min_height, widths)
+    return len(bounds), pages()
 # end
 
 if __name__ == "__main__":
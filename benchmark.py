@@ -0,0 +1,134 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Time the parsing, aggregation and rendering of synthetic mechanics logs
+
+For each log size, the benchmark measures:
+♦ parse: load_log, from the csv file to a LogRows store
+♦ aggregate: LogSession built from that store
+♦ render: the tables of every boss
+♦ stream: LogSession reading the file directly, as the script does
+The best time of a few runs is kept, and the peak memory of each stage is
+measured in a separate run, as tracemalloc slows everything down.
+
+Results can be saved as a JSON baseline. Later runs are compared to it, so
+a regression shows up as a positive change:
+    python benchmark.py --sizes small,medium --save
+    python benchmark.py --sizes small,medium
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from mechanics_log import LogSession, load_log
+from log_generator import generate_log
+from Unicode_table import make_table
+
+# name -> players, bosses, mechanics: about 450, 14k, 210k and 2.1M lines
+SIZES = {
+    "small": (10, 3, 20),
+    "medium": (50, 10, 40),
+    "large": (300, 10, 100),
+    "huge": (1000, 30, 100),
+    }
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "benchmark_baseline.json")
+
+def stages(name):
+    """
+    Return the benchmarked stages, as (stage name, function) pairs
+
+    Each function takes the output of the previous one
+    """
+    def render(session):
+        return [session.table(boss_name) for boss_name in session.bosses]
+    return [
+        ("parse", lambda _: load_log(name)),
+        ("aggregate", lambda rows: LogSession(name, rows)),
+        ("render", render),
+        ("stream", lambda _: LogSession(name)),
+        ]
+
+def measure(name, repeat=3):
+    """
+    Run the stages on a log and return their best time and peak memory
+    """
+    results = {}
+    for _ in range(repeat):
+        previous = None
+        for stage, function in stages(name):
+            start = time.perf_counter()
+            output = function(previous)
+            duration = time.perf_counter() - start
+            if stage != "stream":
+                previous = output
+            result = results.setdefault(stage, {"time": duration})
+            result["time"] = min(result["time"], duration)
+    previous = None
+    for stage, function in stages(name):
+        tracemalloc.start()
+        output = function(previous)
+        results[stage]["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        if stage != "stream":
+            previous = output
+    return results
+
+def compare(results, baseline):
+    """
+    Return a table of the results, with the change from the baseline
+    """
+    data = [["Size", "Stage", "Time (s)", "Change", "Peak (MB)", "Change"]]
+    def change(new, old):
+        if not old:
+            return ""
+        return "{:+.0%}".format(new / old - 1)
+    for size, size_results in results.items():
+        for stage, result in size_results["stages"].items():
+            old = baseline.get(size, {}).get("stages", {}).get(stage, {})
+            data.append([size, stage, "{:.3f}".format(result["time"]),
+                         change(result["time"], old.get("time")),
+                         "{:.1f}".format(result["peak_mb"]),
+                         change(result["peak_mb"], old.get("peak_mb"))])
+    return make_table(data, "1211111", "12" + "0" * (len(data) - 2) + "1")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the mechanics log parser")
+    parser.add_argument("--sizes", default="small,medium,large",
+        help="comma separated log sizes, among {}".format(", ".join(SIZES)))
+    parser.add_argument("--repeat", type=int, default=3,
+        help="number of runs, the best time is kept")
+    parser.add_argument("--baseline", default=BASELINE,
+        help="JSON file of the results to compare with")
+    parser.add_argument("--save", action="store_true",
+        help="save the results as the new baseline")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes.split(","):
+            players, bosses, mechanics = SIZES[size.strip()]
+            name = os.path.join(directory, "{}.csv".format(size))
+            with open(name, "w", newline="") as f:
+                n_lines = generate_log(f, players, bosses, mechanics)
+            print("{}: {} lines".format(size, n_lines), file=sys.stderr)
+            results[size] = {"lines": n_lines,
+                             "stages": measure(name, args.repeat)}
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = {}
+    print(compare(results, baseline))
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        print("Baseline saved to {}".format(args.baseline))
@@ -0,0 +1,324 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Post the mechanics tables to a Discord channel through a webhook
+
+The messages of a log (every page of every selected boss) are gathered first,
+then posted in order over a single HTTP connection, kept open between
+messages. The rate limit headers sent by Discord are followed: when no request
+is left, the publisher waits until the limit is reset, and a 429 answer is
+retried after its Retry-After delay. Server errors and failed connections are
+retried with an exponential backoff.
+A message is only sent again when it is certain that it wasn't posted. If the
+connection is lost once a message has been sent, and before Discord answered,
+publishing stops with a WebhookError instead, so nothing is ever posted twice.
+
+    python discord_webhook.py https://discord.com/api/webhooks/... log.csv
+"""
+
+import argparse
+import asyncio
+import json
+import ssl
+import sys
+import time
+from urllib.parse import urlsplit
+
+from mechanics_log import (DISCORD_LIMIT, LOG_ERRORS, expand_logs,
+                           open_session, select_bosses)
+from log_cache import LogCache
+
+class WebhookError(Exception):
+    """
+    Raised when a message couldn't be posted
+
+    posted is the number of messages posted before the error
+    """
+    def __init__(self, message, posted=0):
+        super().__init__(message)
+        self.posted = posted
+
+class _NotSent(Exception):
+    """
+    Raised when a request failed before being sent, so it can be retried
+    """
+
+class WebhookPublisher:
+    """
+    Asynchronous client posting messages to a webhook on a single connection
+
+    Used as an async context manager:
+        async with WebhookPublisher(url) as publisher:
+            await publisher.publish(messages)
+    """
+    def __init__(self, url, max_retries=5, backoff=1, timeout=30,
+                 username=None):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError("{} isn't an http(s) URL".format(url))
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl = ssl.create_default_context() \
+            if parts.scheme == "https" else None
+        # wait=true makes Discord answer once the message is posted
+        self.target = "{}?{}".format(parts.path or "/", "&".join(
+            q for q in (parts.query, "wait=true") if q))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.username = username
+        # number of messages posted so far
+        self.posted = 0
+        self._reader = self._writer = None
+        # time.monotonic() before which no request can be sent
+        self._wait_until = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+        return False
+
+    async def close(self):
+        """
+        Close the connection, if it is open
+        """
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _connect(self):
+        """
+        Open the connection, unless the current one can be used
+        """
+        if self._writer is not None and not self._reader.at_eof() and \
+                not self._writer.is_closing():
+            return
+        await self.close()
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.ssl),
+                self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise _NotSent("connection failed: {}".format(e)) from e
+
+    async def _read_response(self):
+        """
+        Read a response, and return its status, headers and body
+        """
+        reader = self._reader
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed without a response")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        keep_alive = headers.get("connection", "").lower() != "close"
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b"\r\n", b"\n",
+                                                            b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            # the body ends with the connection
+            body = await reader.read()
+            keep_alive = False
+        if not keep_alive:
+            await self.close()
+        return status, headers, body
+
+    async def _request(self, payload):
+        """
+        Send a message once, and return the status, headers and body
+        """
+        await self._connect()
+        request = (
+            "POST {} HTTP/1.1\r\n"
+            "Host: {}\r\n"
+            "Content-Type: application/json\r\n"
+            "Content-Length: {}\r\n"
+            "User-Agent: Mechanics-log-parser\r\n"
+            "\r\n").format(self.target, self.host, len(payload))
+        try:
+            self._writer.write(request.encode("latin-1") + payload)
+            await self._writer.drain()
+            return await asyncio.wait_for(self._read_response(), self.timeout)
+        except (OSError, EOFError, ValueError, IndexError,
+                asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            # the message may have been received: it can't be sent again
+            await self.close()
+            raise WebhookError("connection lost after sending message {}, " \
+                "it may or may not have been posted: {!r}".format(
+                self.posted + 1, e), self.posted) from e
+
+    def _follow_rate_limit(self, headers):
+        """
+        Delay the next request if the rate limit has been reached
+        """
+        try:
+            if int(headers.get("x-ratelimit-remaining", 1)) <= 0:
+                self._wait_until = max(self._wait_until, time.monotonic() +
+                    float(headers.get("x-ratelimit-reset-after", 0)))
+        except ValueError:
+            pass
+
+    async def post(self, content):
+        """
+        Post a single message, retrying while it certainly wasn't posted
+
+        Return the message created by Discord, as a dict
+        """
+        data = {"content": content}
+        if self.username:
+            data["username"] = self.username
+        payload = json.dumps(data).encode("utf-8")
+        for attempt in range(self.max_retries + 1):
+            delay = self._wait_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                status, headers, body = await self._request(payload)
+            except _NotSent as e:
+                error = str(e)
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                continue
+            self._follow_rate_limit(headers)
+            if 200 <= status < 300:
+                self.posted += 1
+                try:
+                    return json.loads(body) if body else {}
+                except ValueError:
+                    return {}
+            error = "HTTP {}: {}".format(
+                status, body.decode("utf-8", "replace")[:200])
+            if status == 429:
+                # the message was refused: it is sent again once allowed
+                try:
+                    retry_after = float(headers["retry-after"])
+                except (KeyError, ValueError):
+                    try:
+                        retry_after = float(json.loads(body)["retry_after"])
+                    except (ValueError, KeyError, TypeError):
+                        retry_after = self.backoff * 2 ** attempt
+                self._wait_until = max(self._wait_until,
+                                       time.monotonic() + retry_after)
+            elif status >= 500:
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+            else:
+                break
+        raise WebhookError("message {} couldn't be posted: {}".format(
+            self.posted + 1, error), self.posted)
+
+    async def publish(self, messages):
+        """
+        Post messages in order, stopping at the first one that fails
+
+        Return the number of messages posted
+        """
+        posted = self.posted
+        for message in messages:
+            await self.post(message)
+        return self.posted - posted
+
+def log_messages(session, boss_names=None, max_chars=DISCORD_LIMIT):
+    """
+    Return the messages of a log: the pages of the selected bosses, in order
+
+    Raise a ValueError if a message is longer than max_chars or than the
+    limit of Discord
+    """
+    messages = [page for boss_name in select_bosses(session, boss_names)
+                for page in session.pages(boss_name, max_chars)]
+    limit = min(max_chars or DISCORD_LIMIT, DISCORD_LIMIT)
+    for message in messages:
+        if len(message) > limit:
+            raise ValueError("a message of {} has {} characters, more " \
+                "than {}".format(session.name, len(message), limit))
+    return messages
+
+async def publish_logs(url, names, boss_names=None, max_chars=DISCORD_LIMIT,
+                       cache=None, **options):
+    """
+    Post the tables of several logs, using a single connection
+
+    Every log is parsed and all the messages are rendered and checked before
+    posting any of them, so an error never leaves the tables half posted.
+    options are passed to WebhookPublisher. Return the number of messages
+    posted and the list of the logs that couldn't be read. Raise a
+    ValueError, before posting anything, if a message is too long
+    """
+    failed, messages = [], []
+    for name in names:
+        try:
+            messages += log_messages(open_session(name, cache), boss_names,
+                                     max_chars)
+        except LOG_ERRORS:
+            failed.append(name)
+    async with WebhookPublisher(url, **options) as publisher:
+        await publisher.publish(messages)
+        return publisher.posted, failed
+
+def message_size(text):
+    """
+    Return the value of --max-chars, a size of message Discord accepts
+    """
+    size = int(text)
+    if not 1 <= size <= DISCORD_LIMIT:
+        raise argparse.ArgumentTypeError("{} isn't between 1 and {}".format(
+            size, DISCORD_LIMIT))
+    return size
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Post the mechanics tables to a Discord webhook")
+    parser.add_argument("url", help="URL of the webhook")
+    parser.add_argument("logs", nargs="+",
+        help="logs, directories of logs or glob patterns")
+    parser.add_argument("--boss", action="append",
+        help="only post the table of that boss (can be repeated, " +
+        "default: every boss)")
+    parser.add_argument("--max-chars", type=message_size,
+        default=DISCORD_LIMIT,
+        help="maximum size of a message, up to %(default)s (the default)")
+    parser.add_argument("--username",
+        help="name displayed instead of the name of the webhook")
+    args = parser.parse_args()
+
+    names = expand_logs(args.logs)
+    try:
+        posted, failed = asyncio.run(publish_logs(
+            args.url, names, args.boss, args.max_chars, LogCache(),
+            username=args.username))
+    except WebhookError as e:
+        print(e, file=sys.stderr)
+        print("{} messages posted".format(e.posted), file=sys.stderr)
+        sys.exit(1)
+    except ValueError as e:
+        # a table can't be split in messages of --max-chars characters
+        print(e, file=sys.stderr)
+        print("No message posted", file=sys.stderr)
+        sys.exit(1)
+    for name in failed:
+        print("{} could not be read".format(name), file=sys.stderr)
+    print("{} messages posted".format(posted))
+    sys.exit(1 if failed else 0)
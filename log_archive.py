@@ -0,0 +1,444 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Compressed archive of mechanics logs, readable one boss at a time
+
+An archive is a single file holding many logs. Each log is cut in blocks of
+lines, compressed independently with lzma (or zlib, faster but bigger). A new
+block is started when it reaches BLOCK_SIZE bytes, or when the boss changes
+once it holds MIN_BLOCK_SIZE bytes, as the plugin writes the lines of each
+boss together. The index of the archive gives, for each log, the byte range
+of its blocks and the bosses found in each of them, so the table of a boss
+only needs the blocks holding that boss and the "All" lines.
+The original logs can be extracted exactly as they were imported.
+
+The file starts with MAGIC, followed by the blocks, the index (JSON
+compressed with zlib) and a trailer giving the position of the index. Logs
+imported later are appended with a new index, so an interrupted import
+leaves the previous index usable. The blocks of the logs exported again and
+the previous indexes are left unused: compact rewrites the archive without
+them, which an import does once they take more than COMPACT_RATIO of the
+file.
+Logs are archived under their file name. A log from another directory with
+the name of an archived log, but a different content, is refused.
+    python log_archive.py import season.mla <logs, directories or patterns>
+    python log_archive.py table season.mla 20190507-211012.csv --boss Dhuum
+    python log_archive.py compact season.mla
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import locale
+import lzma
+import os
+import struct
+import sys
+import zlib
+
+from mechanics_log import (FORMATS, LOG_ERRORS, LogRows, LogSession,
+                           check_headers, expand_logs, find_boss_position,
+                           process_log, read_lines, write_atomically)
+
+MAGIC = b"MLOGARC1"
+# position and size of the index, followed by MAGIC
+TRAILER = struct.Struct("<QQ")
+TRAILER_SIZE = TRAILER.size + len(MAGIC)
+# maximum size of a block, and size from which a new boss starts a new block
+BLOCK_SIZE = 256 * 1024
+MIN_BLOCK_SIZE = 16 * 1024
+# codec name -> compression and decompression functions
+CODECS = {
+    "lzma": (lzma.compress, lzma.decompress),
+    "zlib": (lambda data: zlib.compress(data, 9), zlib.decompress),
+    }
+# share of unused bytes from which an import compacts the archive
+COMPACT_RATIO = 0.5
+
+class ArchiveError(Exception):
+    """
+    Raised when a file isn't a readable log archive, or when a log can't be
+    added to it
+    """
+
+class LogArchive:
+    """
+    Archive of compressed logs, with an index of their bosses and blocks
+
+    Logs added are written at the end of the file right away, and the index
+    is written by save, called when used as a context manager:
+        with LogArchive("season.mla") as archive:
+            archive.add("20190507-211012.csv")
+    """
+    def __init__(self, path):
+        self.path = path
+        # log name -> size, mtime, codec, headers size, bosses, blocks, path
+        # of the log and SHA-256 of its content. Each block is [offset,
+        # stored size, size, bosses]
+        self.logs = {}
+        self._modified = False
+        if os.path.exists(path):
+            self.logs = self._read_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.save()
+        return False
+
+    def _read_index(self):
+        """
+        Return the logs of the latest complete index of the archive
+        """
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ArchiveError("{} isn't a log archive".format(self.path))
+            logs = self._index_before(f, f.seek(0, os.SEEK_END))
+            if logs is None:
+                # an import was interrupted: the previous index is used
+                f.seek(0)
+                data = f.read()
+                end = len(data)
+                while logs is None:
+                    end = data.rfind(MAGIC, len(MAGIC), end)
+                    if end < 0:
+                        raise ArchiveError("{} has no readable index".format(
+                            self.path))
+                    logs = self._index_before(f, end + len(MAGIC))
+        return logs
+
+    @staticmethod
+    def _index_before(f, end):
+        """
+        Return the logs of the index whose trailer ends at a given position,
+        or None if there is no valid trailer there
+        """
+        if end < len(MAGIC) + TRAILER_SIZE:
+            return None
+        f.seek(end - TRAILER_SIZE)
+        trailer = f.read(TRAILER_SIZE)
+        if trailer[TRAILER.size:] != MAGIC:
+            return None
+        offset, size = TRAILER.unpack(trailer[:TRAILER.size])
+        if offset + size != end - TRAILER_SIZE:
+            return None
+        f.seek(offset)
+        try:
+            return json.loads(zlib.decompress(f.read(size)))["logs"]
+        except (zlib.error, ValueError, KeyError, TypeError):
+            return None
+
+    def add(self, name, codec="lzma"):
+        """
+        Compress a log at the end of the archive
+
+        The log is stored under its file name. A log already archived with
+        the same size and modification time, or the same content, is
+        skipped, and a different version of the same file replaces it.
+        Return whether the log was added. Raise a LogFormatError if it isn't
+        a mechanics log, and an ArchiveError if a log of another directory,
+        with a different content, is archived under the same name
+        """
+        compress = CODECS[codec][0]
+        log_name = os.path.basename(name)
+        path = os.path.abspath(name)
+        encoding = locale.getpreferredencoding(False)
+        with open(name, "rb") as f:
+            stat = os.fstat(f.fileno())
+            known = self.logs.get(log_name)
+            if known and (known["size"], known["mtime"]) == \
+                    (stat.st_size, stat.st_mtime_ns):
+                return False
+            if known and known.get("path", path) != path:
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+                if digest.hexdigest() == known["sha256"]:
+                    return False
+                raise ArchiveError("{} isn't {}, archived under the same " \
+                    "name".format(name, known["path"]))
+            f.seek(0)
+            headers = f.readline()
+            check_headers(headers.decode(encoding), name)
+            entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns,
+                     "codec": codec, "headers": len(headers), "bosses": [],
+                     "blocks": [], "path": path}
+            digest = hashlib.sha256(headers)
+            bosses = {}
+            with open(self.path, "ab") as archive:
+                if archive.tell() == 0:
+                    archive.write(MAGIC)
+                def write_block(lines, block_bosses):
+                    data = b"".join(lines)
+                    stored = compress(data)
+                    entry["blocks"].append([archive.tell(), len(stored),
+                                            len(data), block_bosses])
+                    archive.write(stored)
+                lines, size, block_bosses = [headers], len(headers), []
+                current = None
+                for line in f:
+                    try:
+                        if b'"' in line:
+                            boss_name = next(csv.reader(
+                                [line.decode(encoding)]))[2]
+                        else:
+                            # most lines have no quoted cell
+                            boss_name = line.split(b",", 3)[2].decode(
+                                encoding)
+                    except (StopIteration, IndexError, UnicodeDecodeError,
+                            csv.Error):
+                        boss_name = current
+                    if boss_name != current and boss_name is not None:
+                        if size >= MIN_BLOCK_SIZE:
+                            write_block(lines, block_bosses)
+                            lines, size, block_bosses = [], 0, []
+                        current = boss_name
+                    if size + len(line) > BLOCK_SIZE and lines:
+                        write_block(lines, block_bosses)
+                        lines, size, block_bosses = [], 0, []
+                    if boss_name is not None and \
+                            boss_name not in block_bosses:
+                        block_bosses.append(boss_name)
+                        if boss_name != "All":
+                            bosses.setdefault(boss_name, None)
+                    lines.append(line)
+                    size += len(line)
+                    digest.update(line)
+                if lines:
+                    write_block(lines, block_bosses)
+        entry["bosses"] = list(bosses)
+        entry["sha256"] = digest.hexdigest()
+        self.logs[log_name] = entry
+        self._modified = True
+        return True
+
+    def save(self):
+        """
+        Write the index at the end of the archive, if it changed
+        """
+        if not self._modified:
+            return
+        with open(self.path, "ab") as archive:
+            if archive.tell() == 0:
+                archive.write(MAGIC)
+            self._write_index(archive, self.logs)
+        self._modified = False
+
+    @staticmethod
+    def _write_index(archive, logs):
+        """
+        Write the index of logs and the trailer at the end of an open
+        archive, and wait for them to be on disk
+        """
+        index = zlib.compress(json.dumps({"logs": logs}).encode("utf-8"))
+        offset = archive.tell()
+        archive.write(index)
+        archive.write(TRAILER.pack(offset, len(index)) + MAGIC)
+        archive.flush()
+        os.fsync(archive.fileno())
+
+    def unused_bytes(self):
+        """
+        Return the number of bytes of the archive that aren't blocks of the
+        archived logs: the replaced blocks and the indexes
+        """
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) - len(MAGIC) - sum(
+            block[1] for entry in self.logs.values()
+            for block in entry["blocks"])
+
+    def compact(self):
+        """
+        Rewrite the archive with only the blocks of the archived logs and
+        their index
+
+        The new archive is written in a temporary file, which then replaces
+        the archive. Return the number of bytes freed
+        """
+        self.save()
+        if not os.path.exists(self.path):
+            return 0
+        size = os.path.getsize(self.path)
+        logs = {}
+        def write(out):
+            with open(self.path, "rb") as f:
+                out.write(MAGIC)
+                for log_name, entry in self.logs.items():
+                    blocks = []
+                    for offset, stored, block_size, bosses in entry["blocks"]:
+                        f.seek(offset)
+                        blocks.append([out.tell(), stored, block_size, bosses])
+                        out.write(f.read(stored))
+                    logs[log_name] = dict(entry, blocks=blocks)
+            self._write_index(out, logs)
+        write_atomically(self.path, write)
+        self.logs = logs
+        return size - os.path.getsize(self.path)
+
+    def read(self, log_name, boss_names=None):
+        """
+        Yield the decompressed blocks of a log, headers excluded
+
+        If boss_names is given, only the blocks holding these bosses or
+        "All" lines are read. Raise a KeyError if the log isn't archived
+        """
+        entry = self.logs[log_name]
+        decompress = CODECS[entry["codec"]][1]
+        wanted = None if boss_names is None else set(boss_names) | {"All"}
+        with open(self.path, "rb") as f:
+            for i, (offset, stored, _, bosses) in enumerate(entry["blocks"]):
+                if wanted is not None and wanted.isdisjoint(bosses):
+                    continue
+                f.seek(offset)
+                data = decompress(f.read(stored))
+                yield data[entry["headers"]:] if i == 0 else data
+
+    def session(self, log_name, boss_names=None):
+        """
+        Return the LogSession of an archived log
+
+        If boss_names is given, only the blocks of these bosses are
+        decompressed, and the tables of the other bosses are empty
+        """
+        encoding = locale.getpreferredencoding(False)
+        session = LogSession(log_name, LogRows())
+        wanted = None if boss_names is None else set(boss_names) | {"All"}
+        for data in self.read(log_name, boss_names):
+            for databit in read_lines(io.StringIO(data.decode(encoding),
+                                                  newline=''),
+                                      session.malformed):
+                if wanted is None or databit[2] in wanted:
+                    session.add(databit)
+        # the index knows every boss of the log: the tables need them to
+        # tell whether the log is about a single boss
+        for boss_name in self.logs[log_name]["bosses"]:
+            session.record(boss_name)
+        return session
+
+    def extract(self, log_name, path):
+        """
+        Write an archived log to a file, as it was imported
+        """
+        entry = self.logs[log_name]
+        decompress = CODECS[entry["codec"]][1]
+        def write(out):
+            with open(self.path, "rb") as f:
+                for offset, stored, _, _ in entry["blocks"]:
+                    f.seek(offset)
+                    out.write(decompress(f.read(stored)))
+        write_atomically(path, write)
+        os.utime(path, ns=(entry["mtime"], entry["mtime"]))
+
+def import_logs(archive, names, codec="lzma"):
+    """
+    Add logs to an archive, and save its index
+
+    If logs were added, the archive is compacted once more than
+    COMPACT_RATIO of it is unused. Return the number of logs added, the list of the logs that couldn't be
+    read, and the list of the ones refused as their name is taken
+    """
+    added, failed, refused = 0, [], []
+    try:
+        for name in names:
+            try:
+                added += archive.add(name, codec)
+            except LOG_ERRORS:
+                failed.append(name)
+            except ArchiveError:
+                refused.append(name)
+    finally:
+        archive.save()
+    # a new archive is only created once a log is added
+    if added and archive.unused_bytes() > \
+            COMPACT_RATIO * os.path.getsize(archive.path):
+        archive.compact()
+    return added, failed, refused
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Store mechanics logs in a compressed archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("import",
+        help="add logs to an archive, creating it if needed")
+    command.add_argument("archive", help="archive file")
+    command.add_argument("logs", nargs="+",
+        help="logs, directories of logs or glob patterns")
+    command.add_argument("--codec", choices=list(CODECS), default="lzma",
+        help="compression of the new logs (default: %(default)s)")
+    command = commands.add_parser("list", help="list the archived logs")
+    command.add_argument("archive", help="archive file")
+    command = commands.add_parser("compact",
+        help="rewrite an archive without the blocks of the replaced logs")
+    command.add_argument("archive", help="archive file")
+    command = commands.add_parser("table",
+        help="print the tables of an archived log")
+    command.add_argument("archive", help="archive file")
+    command.add_argument("log", help="file name of the log")
+    command.add_argument("--boss", action="append",
+        help="only print the table of that boss, reading only its blocks " +
+        "(can be repeated, default: every boss)")
+    command.add_argument("--format", choices=list(FORMATS), default="unicode",
+        help="output format (default: %(default)s)")
+    command = commands.add_parser("extract",
+        help="write archived logs back as they were imported")
+    command.add_argument("archive", help="archive file")
+    command.add_argument("logs", nargs="+", help="file names of the logs")
+    command.add_argument("--output", default=".", metavar="DIRECTORY",
+        help="directory of the extracted logs (default: current directory)")
+    args = parser.parse_args()
+
+    try:
+        archive = LogArchive(args.archive)
+    except (ArchiveError, OSError) as e:
+        print(e)
+        sys.exit(1)
+    if args.command == "import":
+        names = expand_logs(args.logs)
+        added, failed, refused = import_logs(archive, names, args.codec)
+        for name in failed:
+            print("{} could not be read".format(name))
+        for name in refused:
+            print("{} has the name of another archived log".format(name))
+        print("{} logs added, {} already archived".format(
+            added, len(names) - added - len(failed) - len(refused)))
+        sys.exit(1 if failed or refused else 0)
+    if args.command == "compact":
+        print("{:.0f} kB freed".format(archive.compact() / 1000))
+        sys.exit()
+    if args.command == "list":
+        for log_name, entry in sorted(archive.logs.items()):
+            stored = sum(block[1] for block in entry["blocks"])
+            print("{}: {} ({} blocks, {:.0f} kB, {:.1%} of {:.0f} kB)".format(
+                log_name, ", ".join(entry["bosses"]), len(entry["blocks"]),
+                stored / 1000, stored / max(entry["size"], 1),
+                entry["size"] / 1000))
+        sys.exit()
+    unknown = [name for name in ([args.log] if args.command == "table"
+                                 else args.logs) if name not in archive.logs]
+    if unknown:
+        print("Not in the archive: {}".format(", ".join(unknown)))
+        sys.exit(1)
+    if args.command == "extract":
+        os.makedirs(args.output, exist_ok=True)
+        for log_name in args.logs:
+            archive.extract(log_name, os.path.join(args.output, log_name))
+        sys.exit()
+    bosses = archive.logs[args.log]["bosses"]
+    if args.boss:
+        wanted = {boss_name.lower() for boss_name in args.boss}
+        bosses = [boss_name for boss_name in bosses
+                  if boss_name.lower() in wanted]
+        if not bosses:
+            print("None of these bosses is in {}".format(args.log))
+            sys.exit(1)
+        session = archive.session(args.log, bosses)
+    else:
+        session = archive.session(args.log)
+    for boss_name in sorted(bosses, key=find_boss_position):
+        print(process_log(session, boss_name, [args.format])[args.format])
+        print()
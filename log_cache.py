@@ -0,0 +1,149 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+On-disk cache of parsed mechanics logs
+
+Each log gets a snapshot file in the cache directory, named after its path.
+The snapshot starts with the size and modification time of the log, and the
+version of the parser that produced it. If any of them doesn't match when the
+snapshot is loaded, it is discarded, so a log that has been exported again is
+parsed again.
+The total size of the cache is bounded: the least recently used snapshots are
+removed first.
+"""
+
+import hashlib
+import os
+import pickle
+
+# default location and size of the cache
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "mechanics_log_cache")
+CACHE_SIZE = 64 * 1024 * 1024
+
+class LogCache:
+    """
+    Snapshots of parsed logs, keyed by path, size, mtime and parser version
+    """
+    def __init__(self, directory=CACHE_DIRECTORY, max_size=CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        # bytes written since the size of the cache was last checked, None if
+        # it has never been checked
+        self._unchecked = None
+
+    def path(self, name):
+        """
+        Return the path of the snapshot of a given log
+        """
+        digest = hashlib.sha1(
+            os.path.abspath(name).encode("utf-8", "surrogateescape"))
+        return os.path.join(self.directory, digest.hexdigest() + ".snapshot")
+
+    @staticmethod
+    def key(name, version):
+        """
+        Return what identifies the current content of a log
+        """
+        stat = os.stat(name)
+        return (os.path.abspath(name), stat.st_size, stat.st_mtime_ns, version)
+
+    def load(self, name, version):
+        """
+        Return the snapshot of a log, or None if there is no valid one
+        """
+        path = self.path(name)
+        try:
+            with open(path, "rb") as f:
+                key = pickle.load(f)
+                if key != self.key(name, version):
+                    raise ValueError("outdated snapshot")
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # outdated or unreadable, it will be replaced
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        # mark the snapshot as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def store(self, name, version, data, key=None):
+        """
+        Save the snapshot of a log, then make room in the cache if needed
+
+        key is the key of the log taken before it was parsed. If the log
+        changed since then, the snapshot is outdated and isn't saved.
+        Return whether the snapshot was saved
+        """
+        if key is None:
+            key = self.key(name, version)
+        elif self.key(name, version) != key:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(name)
+        # write to a temporary file first so a snapshot is never half written
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        # checking the size means listing the cache, so it is only done from
+        # time to time when many logs are stored in a row
+        if self._unchecked is None or self._unchecked > self.max_size // 8:
+            self.evict()
+        else:
+            self._unchecked += os.path.getsize(path)
+        return True
+
+    def evict(self):
+        """
+        Remove the least recently used snapshots until the cache fits
+        """
+        self._unchecked = 0
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".snapshot"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        # removed by another process
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        """
+        Remove every snapshot
+        """
+        max_size, self.max_size = self.max_size, -1
+        try:
+            self.evict()
+        except FileNotFoundError:
+            pass
+        finally:
+            self.max_size = max_size
@@ -0,0 +1,97 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Write synthetic arcdps mechanics logs
+
+The logs use the real headers and boss names. Each player gets one line per
+boss and mechanic they triggered, with the number of pulls they attended, and
+an "All" line with their downs and deaths, like the plugin does. They are used
+by benchmark.py, and can be used to try the script without raiding:
+    python log_generator.py test.csv --players 10 --bosses 3
+"""
+
+import argparse
+import csv
+import random
+
+from mechanics_log import HEADERS, BOSSES
+
+# words used to make up mechanic names
+WORDS = [
+    "Oil", "Bomb", "Green", "Fixate", "Spear", "Shockwave", "Orb", "Slam",
+    "Pool", "Bubble", "Beam", "Wave", "Breakbar", "Soul", "Tear", "Arrow",
+    "Fear", "Pull", "Debuff", "Golem", "Spike", "Puddle", "Charge", "Swipe",
+    ]
+
+def mechanic_names(n, rng):
+    """
+    Return n distinct made up mechanic names
+    """
+    names = set()
+    while len(names) < n:
+        name = "{} {}".format(rng.choice(WORDS), rng.choice(WORDS))
+        if len(names) >= len(WORDS) ** 2:
+            name = "{} {}".format(name, len(names))
+        names.add(name)
+    return sorted(names)
+
+def generate_log(f, players=10, bosses=3, mechanics=20, pulls=5, seed=0):
+    """
+    Write a log to the text file f, and return its number of lines
+
+    players is the number of accounts, bosses the number of boss fights
+    (taken from BOSSES), mechanics the number of mechanics of each boss and
+    pulls the maximal number of attempts on a boss.
+    A few mechanic names contain a comma, as the csv format allows it
+    """
+    rng = random.Random(seed)
+    writer = csv.writer(f, lineterminator="\n")
+    writer.writerow(HEADERS)
+    l_bosses = BOSSES[len(BOSSES) - bosses:] if bosses <= len(BOSSES) else \
+        BOSSES + ["Boss {}".format(i) for i in range(bosses - len(BOSSES))]
+    l_players = [("Character {}".format(i),
+                  ":Player.{:04d}".format(1000 + i)) for i in range(players)]
+    n_lines = 1
+    for boss_name in l_bosses:
+        l_mechanics = mechanic_names(mechanics, rng)
+        if mechanics > 3:
+            l_mechanics[0] = "Quoted, {}".format(l_mechanics[0])
+        # a third of the mechanics are neutral ones
+        failed = {m: rng.random() > 1 / 3 for m in l_mechanics}
+        boss_pulls = rng.randint(1, pulls)
+        for player_name, account_name in l_players:
+            # some players only came for a few attempts
+            p_pulls = boss_pulls if rng.random() > 0.1 else \
+                rng.randint(1, boss_pulls)
+            for m_name in l_mechanics:
+                # not everybody triggers every mechanic
+                if rng.random() < 0.3:
+                    continue
+                nb = rng.randint(1, 3 * p_pulls)
+                writer.writerow([
+                    player_name, account_name, boss_name, m_name,
+                    "" if failed[m_name] else nb, nb if failed[m_name] else "",
+                    "", "", p_pulls])
+                n_lines += 1
+    for player_name, account_name in l_players:
+        writer.writerow([player_name, account_name, "All", "", "", "",
+                         rng.randint(0, 3 * bosses), rng.randint(0, bosses),
+                         len(l_bosses)])
+        n_lines += 1
+    return n_lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic arcdps mechanics log")
+    parser.add_argument("output", help="name of the log to write")
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--bosses", type=int, default=3)
+    parser.add_argument("--mechanics", type=int, default=20)
+    parser.add_argument("--pulls", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with open(args.output, "w", newline="") as f:
+        n_lines = generate_log(f, args.players, args.bosses, args.mechanics,
+                               args.pulls, args.seed)
+    print("{} lines written to {}".format(n_lines, args.output))
@@ -0,0 +1,175 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Compare the mechanics of two raid nights
+
+The counts of both logs are joined by boss, account and mechanic with
+dictionary lookups, so a comparison is linear in the size of the logs. Counts
+are divided by the number of pulls of each account, so nights with a different
+number of attempts can be compared. For each boss fought in both logs, a table
+shows the change of each failed mechanic per pull, for the accounts found in
+both: the mechanics the squad improved on and the ones it regressed on are
+shown in separate groups of columns, and a last line gives the change of the
+whole squad.
+    python mechanics_diff.py last_week.csv this_week.csv --boss Dhuum
+"""
+
+import argparse
+import sys
+
+from mechanics_log import LOG_ERRORS, open_session
+from log_cache import LogCache
+from Unicode_table import make_table
+
+class BossDiff:
+    """
+    Change of the failed mechanics of a boss between two logs
+
+    old and new are the BossRecords of the boss in the reference log and in
+    the compared one, and old_downs and new_downs the downs of the accounts,
+    None if they can't be used
+    """
+    def __init__(self, old, new, old_downs=None, new_downs=None):
+        self.boss_name = new.name
+        self.accounts = sorted(set(old.players) & set(new.players))
+        self.only_old = sorted(set(old.players) - set(new.players))
+        self.only_new = sorted(set(new.players) - set(old.players))
+        mechanics = sorted(old.mechanics_f | new.mechanics_f)
+        use_downs = old_downs is not None and new_downs is not None
+        if use_downs:
+            mechanics.append("was downed")
+        # account -> (old pulls, new pulls)
+        self.pulls = {}
+        # account -> mechanic -> change per pull
+        self.deltas = {}
+        # mechanic -> old and new counts, and old and new pulls of the squad
+        squad = {m: [0, 0, 0, 0] for m in mechanics}
+        for account_name in self.accounts:
+            o_counts = old.players[account_name]
+            n_counts = new.players[account_name]
+            o_pulls = o_counts.get("Pulls") or 0
+            n_pulls = n_counts.get("Pulls") or 0
+            self.pulls[account_name] = (o_pulls, n_pulls)
+            if use_downs:
+                o_counts = dict(o_counts, **{
+                    "was downed": old_downs.get(account_name) or 0})
+                n_counts = dict(n_counts, **{
+                    "was downed": new_downs.get(account_name) or 0})
+            deltas = self.deltas[account_name] = {}
+            for m in mechanics:
+                o_nb, n_nb = o_counts.get(m, 0), n_counts.get(m, 0)
+                # unknown pulls count as a single attempt
+                deltas[m] = n_nb / max(n_pulls, 1) - o_nb / max(o_pulls, 1)
+                totals = squad[m]
+                totals[0] += o_nb
+                totals[1] += n_nb
+                totals[2] += max(o_pulls, 1)
+                totals[3] += max(n_pulls, 1)
+        # mechanic -> change per pull of the whole squad
+        self.squad = {m: (n_nb / n_pulls - o_nb / o_pulls) if n_pulls else 0
+                      for m, (o_nb, n_nb, o_pulls, n_pulls) in squad.items()}
+        # best improvements and worst regressions first
+        self.improvements = sorted((m for m in mechanics if self.squad[m] < 0),
+                                   key=lambda m: (self.squad[m], m))
+        self.regressions = sorted((m for m in mechanics if self.squad[m] > 0),
+                                  key=lambda m: (-self.squad[m], m))
+        self.unchanged = [m for m in mechanics if self.squad[m] == 0]
+
+def format_delta(delta):
+    """
+    Return a change per pull as text
+    """
+    return "0" if delta == 0 else "{:+.2f}".format(delta)
+
+def make_diff_table(diff):
+    """
+    Return the comparison of a boss as a table made Unicode box characters
+    """
+    title = "```\nMechanics changes for {}:\n\n".format(diff.boss_name)
+    if not diff.accounts:
+        return title + "No account took part in both fights```"
+    l_mechanics = diff.improvements + diff.regressions
+    table_data = [["Account Name"] +
+                  ["({})".format(i) for i, m in enumerate(l_mechanics, 1)] +
+                  ["Pulls"]]
+    for account_name in diff.accounts:
+        table_data.append(
+            [account_name.strip(":")] +
+            [format_delta(diff.deltas[account_name][m]) for m in l_mechanics] +
+            ["{}→{}".format(*diff.pulls[account_name])])
+    o_pulls = sum(pulls[0] for pulls in diff.pulls.values())
+    n_pulls = sum(pulls[1] for pulls in diff.pulls.values())
+    table_data.append(["Squad"] +
+                      [format_delta(diff.squad[m]) for m in l_mechanics] +
+                      ["{}→{}".format(o_pulls, n_pulls)])
+    # the improvements and the regressions are separated by a thick line
+    v_lines = "02"
+    for group in (diff.improvements, diff.regressions):
+        if group:
+            v_lines += "1" * (len(group) - 1) + "2"
+    v_lines += "2"
+    h_lines = "02{}22".format((len(diff.accounts) - 1) * "0")
+
+    caption = ""
+    current_index = 1
+    for name, group in (("Improvements", diff.improvements),
+                        ("Regressions", diff.regressions)):
+        if group:
+            caption += "♦ {}:\n".format(name)
+            for i, m in enumerate(group, current_index):
+                caption += "({}): {}\n".format(i, m)
+            current_index += len(group)
+    if diff.unchanged:
+        caption += "♦ Unchanged: {}\n".format(", ".join(diff.unchanged))
+    caption += "♦ Changes of the failed mechanics per pull, since the " + \
+        "reference log\n"
+    for name, accounts in (("reference", diff.only_old),
+                           ("compared", diff.only_new)):
+        if accounts:
+            caption += "♦ Only in the {} log: {}\n".format(
+                name, ", ".join(a.strip(":") for a in accounts))
+    return "{}{}\n{}```".format(
+        title, make_table(table_data, v_lines, h_lines), caption)
+
+def diff_sessions(old, new, boss_names=None):
+    """
+    Compare two LogSessions, and return a BossDiff for each boss in both
+
+    Only the given bosses are compared if boss_names is given, case ignored
+    """
+    bosses = [boss_name for boss_name in new.bosses if boss_name in old.records]
+    if boss_names is not None:
+        boss_names = {boss_name.lower() for boss_name in boss_names}
+        bosses = [boss_name for boss_name in bosses
+                  if boss_name.lower() in boss_names]
+    # downs are only relevant if each log is about a single boss
+    old_downs = old.downs if old.one_boss else None
+    new_downs = new.downs if new.one_boss else None
+    return [BossDiff(old.records[boss_name], new.records[boss_name],
+                     old_downs, new_downs) for boss_name in bosses]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the mechanics of two raid nights")
+    parser.add_argument("reference", help="log of the previous raid night")
+    parser.add_argument("compared", help="log of the raid night to compare")
+    parser.add_argument("--boss", action="append",
+        help="only compare that boss (can be repeated, default: every boss " +
+        "fought in both logs)")
+    args = parser.parse_args()
+
+    cache = LogCache()
+    sessions = []
+    for name in (args.reference, args.compared):
+        try:
+            sessions.append(open_session(name, cache))
+        except LOG_ERRORS:
+            print("{} could not be read".format(name))
+            sys.exit(1)
+    diffs = diff_sessions(*sessions, args.boss)
+    if not diffs:
+        print("No boss was fought in both logs")
+    for diff in diffs:
+        print(make_diff_table(diff))
+        print()
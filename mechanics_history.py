@@ -0,0 +1,221 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Keep the mechanics of every raid night in a SQLite database
+
+The ingest command adds logs to the database. A log is identified by the hash
+of its content, so ingesting the same log again, even under another name,
+does nothing.
+The query command builds the usual mechanics table of a boss from the history,
+for example over the last 20 sessions on that boss:
+    python mechanics_history.py ingest C:\\path\\to\\arcdps.mechanics
+    python mechanics_history.py query Samarog --last 20
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+
+from mechanics_log import (LOG_ERRORS, BossRecord, expand_logs,
+                           find_boss_position, make_boss_table, open_session)
+from log_cache import LogCache
+
+# default location of the database
+DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "mechanics_history.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    one_boss INTEGER NOT NULL
+    );
+CREATE TABLE IF NOT EXISTS players (
+    boss TEXT NOT NULL,
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    account TEXT NOT NULL,
+    character TEXT,
+    pulls INTEGER NOT NULL,
+    downs INTEGER,
+    PRIMARY KEY (boss, session_id, account)
+    ) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS mechanics (
+    boss TEXT NOT NULL,
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    account TEXT NOT NULL,
+    mechanic TEXT NOT NULL,
+    failed INTEGER NOT NULL,
+    nb INTEGER NOT NULL,
+    PRIMARY KEY (boss, session_id, account, mechanic, failed)
+    ) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_mtime ON sessions (mtime);
+CREATE INDEX IF NOT EXISTS players_account ON players (account, boss);
+CREATE INDEX IF NOT EXISTS mechanics_account ON mechanics (account, boss);
+"""
+
+def connect(path=DATABASE):
+    """
+    Open the database, creating its tables if needed
+    """
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    return db
+
+def hash_log(name):
+    """
+    Return the hash of the content of a log
+    """
+    digest = hashlib.sha256()
+    with open(name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def ingest_log(db, name, cache=None):
+    """
+    Add a log to the database
+
+    Return False if the log was already there
+    """
+    digest = hash_log(name)
+    if db.execute("SELECT 1 FROM sessions WHERE hash = ?",
+                  (digest,)).fetchone():
+        return False
+    session = open_session(name, cache)
+    with db:
+        session_id = db.execute(
+            "INSERT INTO sessions (hash, name, mtime, one_boss) " +
+            "VALUES (?, ?, ?, ?)",
+            (digest, os.path.basename(name), os.stat(name).st_mtime,
+             session.one_boss)).lastrowid
+        players, mechanics = [], []
+        for boss_name, record in session.records.items():
+            for account_name, counts in record.players.items():
+                players.append((
+                    boss_name, session_id, account_name,
+                    counts.get("Player Name"), counts.get("Pulls", 0),
+                    session.downs.get(account_name) if session.one_boss
+                    else None))
+                for failed, l_mechanics in ((1, record.mechanics_f),
+                                            (0, record.mechanics_n)):
+                    for m_name in l_mechanics:
+                        if m_name in counts:
+                            mechanics.append((
+                                boss_name, session_id, account_name, m_name,
+                                failed, counts[m_name]))
+        db.executemany("INSERT INTO players VALUES (?, ?, ?, ?, ?, ?)",
+                       players)
+        db.executemany("INSERT INTO mechanics VALUES (?, ?, ?, ?, ?, ?)",
+                       mechanics)
+    return True
+
+def history_record(db, boss_name, last=None):
+    """
+    Gather the history of a boss
+
+    Only the last sessions on that boss are used if last is given. Return
+    the BossRecord with the summed counts, the summed downs (None if they
+    can't be used) and the number of sessions
+    """
+    db.execute("DROP TABLE IF EXISTS temp.selected")
+    db.execute(
+        "CREATE TEMP TABLE selected AS " +
+        "SELECT id, one_boss FROM sessions WHERE id IN " +
+        "(SELECT DISTINCT session_id FROM players WHERE boss = ?) " +
+        "ORDER BY mtime DESC LIMIT ?",
+        (boss_name, -1 if last is None else last))
+    n_sessions, n_one_boss = db.execute(
+        "SELECT COUNT(*), TOTAL(one_boss) FROM temp.selected").fetchone()
+    record = BossRecord(boss_name)
+    downs = {}
+    for account_name, character, pulls, nb_downs in db.execute(
+            "SELECT account, MAX(character), SUM(pulls), SUM(downs) " +
+            "FROM players WHERE boss = ? AND session_id IN " +
+            "(SELECT id FROM temp.selected) GROUP BY account",
+            (boss_name,)):
+        record.players[account_name] = {
+            "Player Name": character, "Pulls": pulls}
+        downs[account_name] = nb_downs
+    for account_name, m_name, failed, nb in db.execute(
+            "SELECT account, mechanic, failed, SUM(nb) " +
+            "FROM mechanics WHERE boss = ? AND session_id IN " +
+            "(SELECT id FROM temp.selected) " +
+            "GROUP BY account, mechanic, failed",
+            (boss_name,)):
+        (record.mechanics_f if failed else record.mechanics_n).add(m_name)
+        record.players[account_name][m_name] = nb
+    # downs are only known for the sessions about a single boss
+    if n_sessions == 0 or n_one_boss < n_sessions:
+        downs = None
+    return record, downs, n_sessions
+
+def per_pull(record, downs):
+    """
+    Divide the counts of a record and the downs by the number of pulls
+    """
+    for account_name, counts in record.players.items():
+        pulls = counts.get("Pulls") or 1
+        for key, nb in counts.items():
+            if key not in ("Player Name", "Pulls"):
+                counts[key] = "{:.2f}".format(nb / pulls)
+        if downs and downs.get(account_name) is not None:
+            downs[account_name] = "{:.2f}".format(downs[account_name] / pulls)
+
+def bosses(db):
+    """
+    Return the list of the bosses in the database
+    """
+    return sorted((boss for boss, in db.execute(
+        "SELECT DISTINCT boss FROM players")), key=find_boss_position)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Keep the mechanics of every raid night in a database")
+    parser.add_argument("--database", default=DATABASE,
+        help="path of the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest",
+        help="add logs to the database")
+    ingest.add_argument("paths", nargs="+",
+        help="logs, directories of logs or glob patterns")
+    query = commands.add_parser("query",
+        help="print the table of a boss over the history")
+    query.add_argument("boss", nargs="?",
+        help="boss name. If missing, the bosses of the database are listed")
+    query.add_argument("--last", type=int,
+        help="only use the last LAST sessions on that boss")
+    query.add_argument("--per-pull", action="store_true",
+        help="divide the counts by the number of pulls")
+    args = parser.parse_args()
+
+    db = connect(args.database)
+    if args.command == "ingest":
+        cache = LogCache()
+        added = skipped = 0
+        for name in expand_logs(args.paths):
+            try:
+                if ingest_log(db, name, cache):
+                    added += 1
+                else:
+                    skipped += 1
+            except LOG_ERRORS:
+                print("{} could not be read".format(name))
+        print("{} logs added, {} already known".format(added, skipped))
+    elif args.boss is None:
+        for boss_name in bosses(db):
+            print(boss_name)
+    else:
+        record, downs, n_sessions = history_record(db, args.boss, args.last)
+        if n_sessions == 0:
+            print("No session found for {}".format(args.boss))
+            sys.exit(1)
+        if args.per_pull:
+            per_pull(record, downs)
+        print("{} sessions".format(n_sessions))
+        print(make_boss_table(record, downs or {}, downs is not None))
+    db.close()
@@ -34,7 +34,8 @@ directory will be saved in mechanics_log_settings.ini for subsequent runs.
 If the log contains the data for several bosses, the script will ask which
 boss fights should be processed. It is possible to answer with more than one
 fight, using commas (1, 2, 4 for example). The bosses will be processed one
-after the other.
+after the other. Their tables are all drawn in the background as soon as they
+are chosen, so the next one is ready when the previous one has been pasted.
 If the win32api module is not installed, the script will move on to the next
 boss after return has been used.
 If it is installed, the script will move on after a specific key (set in
@@ -44,6 +45,46 @@ has been pressed and released. The default value for this key is "V", so that
 pasting the log in Discord using ctrl+V automatically triggers the next log
 processing.
 
+Discord messages are limited to 2000 characters. Longer tables are split
+between groups of players, each part repeating the header of the table and
+its caption, and the parts are copied one after the other like the tables of
+different bosses. The --max-chars option changes that limit (0 to never split
+tables).
+
+Launching the script with the --follow option watches the mechanics log
+folder instead. Each time a log is exported, the tables of the bosses whose
+mechanics changed are printed (and the last one is copied in the clipboard).
+Only the part of the log written since the previous export is parsed, unless
+the whole log has been rewritten. Hit Ctrl+C to stop.
+
+The --with-boss option lists the logs of the mechanics log folder containing a
+given boss, for example --with-boss Dhuum. The content of the folder is kept in
+a catalog, so only new or modified logs are opened again.
+
+The --batch option merges many logs, for example for a weekly review: give it
+a directory (--batch logs) or a glob pattern (--batch "logs/2019-05-*.csv").
+The logs are parsed in parallel, one process per core unless --workers is
+given, and the tables of every boss are printed with the counts of all the
+logs added together. If some logs can't be read, they are listed and the
+script exits with the status 1.
+
+The --output and --stdout options run the script without asking anything, for
+example on a server. Give it logs, directories of logs or glob patterns: each
+log is parsed once, and the tables of all its bosses (or only the ones given
+with --boss, which can be repeated) are written in the output directory, one
+file per log and boss ("log name - boss name.txt"), and/or printed. Files are
+written through a temporary file, so they are never half written. The --format
+option gives the output formats, separated by commas: unicode (the default),
+json, csv and markdown. All of them are built from the same gathered counts.
+The arguments matching no log, the logs that can't be read and the --boss
+names matching no boss of any log are listed on the error output, and the
+script then exits with the status 1.
+
+The --profile option prints the time, number of rows and memory peak of each
+stage of the script once the tables are displayed. --profile-json FILE saves
+them, and --profile-dump FILE saves the cProfile statistics of the slowest
+stage.
+
 
 Remarks:
 
@@ -64,10 +105,20 @@ It seems that hitting "export" and "reset" between different bosses (so each
 of the bosses has its own log) breaks the addon, and it stops recording some 
 mechanics. Avoid it for now.
 
+Parsed logs are cached in the mechanics_log_cache directory, next to the
+script, so processing the same log again doesn't require reading it. A log is
+parsed again as soon as it changes, and the directory can safely be deleted.
+
+Logs of more than 32 MB, like the export of a whole day of pugs, are split in
+ranges of lines parsed by several processes, one per core unless --workers is
+given.
+
 
 Requirements/dependencies
 ♦ Unicode_table.py: this script is imported and used to draw the table around
 the data
+♦ log_cache.py: this script is imported and used to cache the parsed logs
+♦ profiler.py: this script is imported and used by the --profile option
 ♦ pyperclip: automatically copies the table in the clipboard. Not required.
 ♦ win32api/pywin32: used for a faster processing of logs for different bosses.
 It can be installed with pip install pywin32. Not required.
@@ -81,38 +132,23 @@ please contact me on Discord (Aikan#4668) or in-game (Aikan.5674).
 
 import os
 import sys
-import configparser
+import csv
+import glob
+import hashlib
+import io
+import json
+import locale
+import mmap
 import time
+import zlib
+from array import array
+from collections import Counter
 
-try:
-    import pyperclip
-    print("Warning: this script will erase the clipboard content\n")
-    clipboard = True
-except ModuleNotFoundError:
-    print("With the pyperclip module installed, this script copies the table" +
-    " in the clipboard\nso it can directly be pasted in Discord\n")
-    clipboard = False
-
-try:
-    import win32api
-    has_win32api = True
-    try:
-        config = configparser.ConfigParser()
-        config.read("mechanics_log_settings.ini")
-        if config.has_section("Config"):
-            hold_key = int(config["Config"]["HoldingKey"], 16)
-        else:
-            config["Config"] = {}
-            raise KeyError
-    except KeyError:
-        hold_key = 0x56
-        config["Config"]["HoldingKey"] = "0x56"
-        with open("mechanics_log_settings.ini", 'w') as configfile:
-            config.write(configfile)
-except ModuleNotFoundError:
-    has_win32api = False
-
-from Unicode_table import make_table
+from Unicode_table import make_table, paginate_table
+import profiler
+from profiler import stage
+import log_cache
+from log_cache import LogCache
 
 # expected csv headers
 HEADERS = [
@@ -120,6 +156,16 @@ HEADERS = [
     'Boss Name', 'Mechanic Name',
     'Neutral', 'Failed', 'Downs', 'Deaths', 'Pulls'
     ]
+# version of the parsing and aggregation code. Change it when their output
+# changes, so cached logs are parsed again
+PARSER_VERSION = 2
+# headers of the columns holding names, and of the ones holding numbers
+STRING_HEADERS = HEADERS[:4]
+COUNT_HEADERS = HEADERS[4:]
+# maximum size of a Discord message
+DISCORD_LIMIT = 2000
+# size from which a log is parsed by several processes, see parse_log_parallel
+PARALLEL_SIZE = 32 * 1024 * 1024
 # list of bosses, used to sort them
 BOSSES = [
     "FotM Generic", "MAMA", "Siax", "Ensolyss of the Endless Torment", "Arkk",
@@ -131,6 +177,51 @@ BOSSES = [
     "Conjured Amalgamate", "Twin Largos", "Qadim",
     ]
 
+# optional modules and settings of the command line interface. Importing this
+# script has no side effect: they are only loaded by load_cli
+pyperclip = None
+clipboard = False
+win32api = None
+has_win32api = False
+hold_key = 0x56
+
+def load_cli():
+    """
+    Load the optional modules and the settings used by the script
+
+    pyperclip is used to copy the tables in the clipboard, and win32api to
+    wait for the holding key, read from mechanics_log_settings.ini
+    """
+    global pyperclip, clipboard, win32api, has_win32api, hold_key
+    import configparser
+    try:
+        import pyperclip
+        print("Warning: this script will erase the clipboard content\n")
+        clipboard = True
+    except ModuleNotFoundError:
+        print("With the pyperclip module installed, this script copies the " +
+        "table in the clipboard\nso it can directly be pasted in Discord\n")
+        clipboard = False
+
+    try:
+        import win32api
+        has_win32api = True
+        try:
+            config = configparser.ConfigParser()
+            config.read("mechanics_log_settings.ini")
+            if config.has_section("Config"):
+                hold_key = int(config["Config"]["HoldingKey"], 16)
+            else:
+                config["Config"] = {}
+                raise KeyError
+        except KeyError:
+            hold_key = 0x56
+            config["Config"]["HoldingKey"] = "0x56"
+            with open("mechanics_log_settings.ini", 'w') as configfile:
+                config.write(configfile)
+    except ModuleNotFoundError:
+        has_win32api = False
+
 def find_boss_position(name):
     """
     Find the position of a given boss in the above table
@@ -161,6 +252,7 @@ def get_log_directory():
     """
     Look for the log directory in a config file, create it if needed
     """
+    import configparser
     try:
         config = configparser.ConfigParser()
         config.read("mechanics_log_settings.ini")
@@ -185,51 +277,855 @@ def get_log_directory():
         return dir
 
 
-def get_ctime(filename):
+class LogFormatError(Exception):
     """
-    Return the creation time of a file
-    
-    Used to sort them
+    Raised when a file doesn't start with the expected csv headers
+    """
+
+# errors raised when a log can't be read: the log is skipped
+LOG_ERRORS = (LogFormatError, OSError, UnicodeDecodeError)
+
+def check_headers(line, name):
+    """
+    Raise a LogFormatError if the first line of a log isn't HEADERS
+    """
+    if [h.strip() for h in next(csv.reader([line]), [])] != HEADERS:
+        raise LogFormatError("{} isn't a mechanics log".format(name))
+
+def read_lines(lines, malformed=None):
+    """
+    Parse the lines of a log, headers excluded, and yield their data bits
+
+    Each data bit is a list of values, in the HEADERS order. The numbers are
+    converted to int, and empty cells to None.
+    Lines that can't be read are skipped. If malformed is given (typically a
+    Counter), they are counted in it
+    """
+    n_headers = len(HEADERS)
+    reader = csv.reader(lines)
+    while True:
+        try:
+            for line in reader:
+                if len(line) == n_headers:
+                    try:
+                        line[4:] = [int(elem) if elem else None
+                                    for elem in line[4:]]
+                        yield line
+                        continue
+                    except ValueError:
+                        pass
+                if malformed is not None and line:
+                    malformed[",".join(line)] += 1
+            return
+        except csv.Error as e:
+            # a cell too long, a NUL character...: the reader goes on with
+            # the next line
+            if malformed is not None:
+                malformed["line {} after the headers: {}".format(
+                    reader.line_num, e)] += 1
+
+def read_log(name, malformed=None):
+    """
+    Read a log and yield its data bits one at a time
+
+    See read_lines for the format of the data bits and the use of malformed
+    """
+    with open(name, newline='') as f:
+        check_headers(f.readline(), name)
+        yield from read_lines(f, malformed)
+
+class LogRows:
+    """
+    Columnar store of the data bits of a log
+
+    Names are coded as integers, using a single table for the four name
+    columns: a log only holds a few accounts, bosses and mechanics, so each
+    of them is stored once. Every column is an array('i'), and empty counts
+    are stored as EMPTY.
+    Indexing or iterating the store gives back the data bits as dicts
+    """
+    EMPTY = -1
+
+    def __init__(self, databits=()):
+        # code -> name, and name -> code
+        self.names = []
+        self.codes = {}
+        self.columns = {key: array('i') for key in HEADERS}
+        self.extend(databits)
+
+    def code(self, name):
+        """
+        Return the code of a name, adding it to the table if needed
+        """
+        try:
+            return self.codes[name]
+        except KeyError:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+            return self.codes[name]
+
+    def append(self, databit):
+        """
+        Add a data bit, as yielded by read_log, at the end of the store
+        """
+        self.extend([databit])
+
+    def extend(self, databits):
+        """
+        Add data bits, as yielded by read_log, at the end of the store
+        """
+        # the loop is unrolled, as it runs once per line of the log
+        codes, code, empty = self.codes, self.code, self.EMPTY
+        (p_append, a_append, b_append, m_append, n_append, f_append,
+         d_append, de_append, pu_append) = [self.columns[key].append
+                                            for key in HEADERS]
+        for p, a, b, m, n, f, d, de, pu in databits:
+            p_append(codes[p] if p in codes else code(p))
+            a_append(codes[a] if a in codes else code(a))
+            b_append(codes[b] if b in codes else code(b))
+            m_append(codes[m] if m in codes else code(m))
+            n_append(empty if n is None else n)
+            f_append(empty if f is None else f)
+            d_append(empty if d is None else d)
+            de_append(empty if de is None else de)
+            pu_append(empty if pu is None else pu)
+
+    def __len__(self):
+        return len(self.columns["Pulls"])
+
+    def __getitem__(self, i):
+        databit = {key: self.names[self.columns[key][i]]
+                   for key in STRING_HEADERS}
+        for key in COUNT_HEADERS:
+            nb = self.columns[key][i]
+            databit[key] = None if nb == self.EMPTY else nb
+        return databit
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def load_log(name, malformed=None):
+    """
+    Load a log into a columnar store of data bits
+    """
+    return LogRows(read_log(name, malformed))
+
+class BossRecord:
+    """
+    Mechanics recorded for a given boss, gathered one data bit at a time
+    """
+    def __init__(self, name):
+        self.name = name
+        self.mechanics_f = set()
+        self.mechanics_n = set()
+        # account name -> character name, pulls and mechanics counts
+        self.players = {}
+
+    def add(self, player_name, account_name, mechanic_name,
+            neutral, failed, pulls):
+        """
+        Add the content of a data bit about that boss to the record
+        """
+        player = self.players.setdefault(account_name, {})
+        # characters name can be used to change the table layout
+        player["Player Name"] = player_name
+        if pulls is not None:
+            player["Pulls"] = pulls
+        if failed is not None:
+            self.mechanics_f.add(mechanic_name)
+            player[mechanic_name] = failed
+        elif neutral is not None:
+            self.mechanics_n.add(mechanic_name)
+            player[mechanic_name] = neutral
+
+    def merge(self, other):
+        """
+        Add the counts of the record of the same boss in another log
+        """
+        self.mechanics_f |= other.mechanics_f
+        self.mechanics_n |= other.mechanics_n
+        for account_name, counts in other.players.items():
+            player = self.players.setdefault(account_name, {})
+            for key, nb in counts.items():
+                if key == "Player Name":
+                    player[key] = nb
+                else:
+                    player[key] = player.get(key, 0) + nb
+
+class LogSession:
     """
-    return os.stat(filename).st_ctime
+    A log read once, with its mechanics gathered by boss
+
+    The log is streamed a single time, unless a LogRows store is given. The
+    data bits are added to the record of their boss, or to the downs count
+    for the "All" lines, and are not kept. The tables are only built when
+    they are requested, then kept for later use
+    """
+    def __init__(self, name, rows=None):
+        self.name = name
+        # boss name -> BossRecord
+        self.records = {}
+        # account name -> number of downs, from the "All" lines
+        self.downs = {}
+        # malformed line -> number of times it was found
+        self.malformed = Counter()
+        # number of data bits read
+        self.n_rows = 0
+        if rows is None:
+            for databit in read_log(name, self.malformed):
+                self.add(databit)
+        else:
+            self.add_rows(rows)
+        self._tables = {}
+
+    def record(self, boss_name):
+        """
+        Return the record of a given boss, creating it if needed
+        """
+        if boss_name not in self.records:
+            self.records[boss_name] = BossRecord(boss_name)
+        return self.records[boss_name]
+
+    def add(self, databit):
+        """
+        Add a single data bit, as yielded by read_log, to the session
+        """
+        p_name, a_name, b_name, m_name, n, f, d, _, pulls = databit
+        self.n_rows += 1
+        if b_name == "All":
+            self.downs[a_name] = d
+        else:
+            self.record(b_name).add(p_name, a_name, m_name, n, f, pulls)
+
+    def add_rows(self, rows):
+        """
+        Add the content of a LogRows store to the session
+
+        The columns are read directly, and names are only decoded when used
+        """
+        names, empty = rows.names, rows.EMPTY
+        self.n_rows += len(rows)
+        all_code = rows.codes.get("All")
+        # boss code -> BossRecord
+        records = {}
+        for p, a, b, m, n, f, d, pulls in zip(
+                *[rows.columns[key] for key in HEADERS if key != "Deaths"]):
+            if b == all_code:
+                self.downs[names[a]] = None if d == empty else d
+                continue
+            if b not in records:
+                records[b] = self.record(names[b])
+            records[b].add(names[p], names[a], names[m],
+                           None if n == empty else n,
+                           None if f == empty else f,
+                           None if pulls == empty else pulls)
+
+    def update(self, databits):
+        """
+        Add new data bits to the session
+
+        Return the set of bosses whose table changed. These tables will be
+        built again when requested
+        """
+        one_boss, downs = self.one_boss, dict(self.downs)
+        changed = set()
+        for databit in databits:
+            self.add(databit)
+            boss_name = databit[2]
+            if boss_name != "All":
+                changed.add(boss_name)
+        # the "was downed" column depends on the other bosses and the downs
+        if self.one_boss != one_boss or self.one_boss and self.downs != downs:
+            changed.update(self.records)
+        for boss_name in changed:
+            self._tables.pop(boss_name, None)
+        return changed
+
+    def merge(self, other):
+        """
+        Add the counts of another session, typically from another log
+
+        Counts are summed, so the tables of the merged session cover all the
+        attempts of both logs
+        """
+        for boss_name, record in other.records.items():
+            self.record(boss_name).merge(record)
+        for account_name, nb in other.downs.items():
+            if nb is not None:
+                self.downs[account_name] = \
+                    (self.downs.get(account_name) or 0) + nb
+            else:
+                self.downs.setdefault(account_name, None)
+        self.malformed.update(other.malformed)
+        self.n_rows += other.n_rows
+        self._tables = {}
+
+    def concatenate(self, other):
+        """
+        Add a session made from the part of the same log following this one
+
+        Unlike merge, counts are not summed: as when the log is read in one
+        go, the values of the later part replace the earlier ones
+        """
+        for boss_name, other_record in other.records.items():
+            record = self.record(boss_name)
+            record.mechanics_f |= other_record.mechanics_f
+            record.mechanics_n |= other_record.mechanics_n
+            for account_name, counts in other_record.players.items():
+                record.players.setdefault(account_name, {}).update(counts)
+        self.downs.update(other.downs)
+        self.malformed.update(other.malformed)
+        self.n_rows += other.n_rows
+        self._tables = {}
 
-def find_latest_log():
-    log = sorted(os.listdir(), key=lambda file:get_ctime(file))[-1]
-    return log
+    def pages(self, boss_name, max_chars=DISCORD_LIMIT):
+        """
+        Yield the table for a given boss as messages of at most max_chars
+        characters, see table_pages
 
-def load_log(name):
+        If max_chars is 0 or None, the table is never split
+        """
+        if not max_chars:
+            yield self.table(boss_name)
+        else:
+            yield from table_pages(self.boss_table(boss_name), max_chars)
+
+    def snapshot(self):
+        """
+        Return the parsed content of the session as plain data, to be cached
+        """
+        return {
+            "records": {boss_name: (record.mechanics_f, record.mechanics_n,
+                                    record.players)
+                        for boss_name, record in self.records.items()},
+            "downs": self.downs,
+            "malformed": self.malformed,
+            "n_rows": self.n_rows,
+            }
+
+    @classmethod
+    def from_snapshot(cls, name, snapshot):
+        """
+        Create a session from the output of snapshot, without reading the log
+        """
+        session = cls.__new__(cls)
+        session.name = name
+        session.records = {}
+        for boss_name, (mechanics_f, mechanics_n, players) in \
+                snapshot["records"].items():
+            record = session.record(boss_name)
+            record.mechanics_f = mechanics_f
+            record.mechanics_n = mechanics_n
+            record.players = players
+        session.downs = snapshot["downs"]
+        session.malformed = snapshot["malformed"]
+        session.n_rows = snapshot["n_rows"]
+        session._tables = {}
+        return session
+
+    @property
+    def bosses(self):
+        """
+        Sorted list of the bosses found in the log
+        """
+        return sorted(self.records, key=find_boss_position)
+
+    @property
+    def accounts(self):
+        """
+        Set of the accounts found in the log
+        """
+        accounts = set(self.downs)
+        for record in self.records.values():
+            accounts.update(record.players)
+        return accounts
+
+    @property
+    def one_boss(self):
+        """
+        Whether the was_downed stat can be used
+        """
+        return len(self.records) == 1
+
+    def boss_table(self, boss_name):
+        """
+        Return the BossTable of a given boss
+        """
+        return BossTable(self.records.get(boss_name, BossRecord(boss_name)),
+                         self.downs, self.one_boss)
+
+    def export(self, boss_name, formats=None):
+        """
+        Return the table of a given boss in several formats (all of FORMATS
+        by default), as a dict format -> text. The counts are only gathered
+        once
+        """
+        if formats is None:
+            formats = FORMATS
+        table = self.boss_table(boss_name)
+        return {fmt: FORMATS[fmt][1](table) for fmt in formats}
+
+    def table(self, boss_name):
+        """
+        Return the table for a given boss, building it if needed
+        """
+        if boss_name not in self._tables:
+            self._tables[boss_name] = make_boss_table(
+                self.records.get(boss_name, BossRecord(boss_name)),
+                self.downs, self.one_boss)
+        return self._tables[boss_name]
+
+def log_ranges(name, n_ranges):
+    """
+    Split the lines of a log, headers excluded, in about n_ranges parts
+
+    Raise a LogFormatError if the log doesn't start with the expected
+    headers. Return a list of (start, end) byte offsets, each range starting
+    at the beginning of a line
     """
-    Load a log into a list of data bits
+    with open(name, "rb") as f:
+        header = f.readline()
+        check_headers(header.decode(locale.getpreferredencoding(False)),
+                      name)
+        size = os.fstat(f.fileno()).st_size
+        start = len(header)
+        if start >= size:
+            return []
+        ranges = []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            step = max((size - start) // n_ranges, 1)
+            while start < size:
+                end = mm.find(b"\n", min(start + step, size) - 1)
+                end = size if end == -1 else end + 1
+                ranges.append((start, end))
+                start = end
+        return ranges
+
+def summarize_range(name, start, end):
+    """
+    Parse the lines of a log between two byte offsets, and return the
+    snapshot of that part of the log
+
+    Used by the worker processes of parse_log_parallel
     """
-    f = open(name)
-    assert f.readline().strip().split(',') == HEADERS
-    data = []
-    for line in f.readlines():
-        data.append({key: elem for key, elem in zip(
-                                HEADERS, line.strip().split(','))})
-    f.close()
-    return data
+    with open(name, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # the lines are decoded as a whole, as open would do line by line
+        text = mm[start:end].decode(locale.getpreferredencoding(False))
+    session = LogSession(name, LogRows())
+    for databit in read_lines(io.StringIO(text, newline=''),
+                              session.malformed):
+        session.add(databit)
+    return session.snapshot()
 
-def get_boss_names(file):
+def parse_log_parallel(name, workers=None):
     """
-    Process a log and get the list of bosses the user is interested in
+    Parse a log with several processes and return its LogSession
+
+    The file is memory mapped and split in ranges of whole lines, each of
+    them parsed and gathered by boss in a worker process. Only the snapshots
+    of the ranges are sent back, and they are concatenated in order, so the
+    session is the same as LogSession(name) would give.
+    Quoted csv fields can't hold line breaks, as the ranges are split on them
     """
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    # a few ranges per process balance the work between them
+    ranges = log_ranges(name, 2 * workers)
+    starts = [start for start, _ in ranges]
+    ends = [end for _, end in ranges]
+    session = LogSession(name, LogRows())
+    with ProcessPoolExecutor(workers) as executor:
+        for snapshot in executor.map(summarize_range, [name] * len(ranges),
+                                     starts, ends):
+            session.concatenate(LogSession.from_snapshot(name, snapshot))
+    return session
+
+def parse_log(name, workers=None):
+    """
+    Return the LogSession of a log, parsed by several processes if it is big
+
+    workers is the number of processes. By default, logs of at least
+    PARALLEL_SIZE bytes use one per core, and smaller ones are parsed
+    directly
+    """
+    if workers is None:
+        workers = 1 if os.path.getsize(name) < PARALLEL_SIZE else \
+            os.cpu_count() or 1
+    if workers <= 1:
+        return LogSession(name)
+    return parse_log_parallel(name, workers)
+
+def open_session(name, cache=None, workers=None):
+    """
+    Return the LogSession of a log, using the cache when possible
+
+    If the cache holds a snapshot of the current version of the log, the log
+    isn't read at all. Otherwise it is parsed (see parse_log for workers) and
+    its snapshot is saved, unless the log was exported again while it was
+    parsed
+    """
+    if cache is None:
+        with stage("parse") as s:
+            session = parse_log(name, workers)
+            s.rows = session.n_rows
+        return session
+    with stage("cache load"):
+        snapshot = cache.load(name, PARSER_VERSION)
+    if snapshot is not None:
+        return LogSession.from_snapshot(name, snapshot)
+    # the key is taken before parsing: a snapshot of the parsed content must
+    # not be saved for a newer version of the log
+    key = cache.key(name, PARSER_VERSION)
+    with stage("parse") as s:
+        session = parse_log(name, workers)
+        s.rows = session.n_rows
     try:
-        data = load_log(file)
-    except AssertionError:
-        print("The log file isn't correctly formatted")
-        return ""
-    
-    s_bosses = set([databit["Boss Name"] for databit in data])-set(["All"])
-    if len(s_bosses) == 1:
-        boss_names = [s_bosses.pop()]
+        with stage("cache store"):
+            cache.store(name, PARSER_VERSION, session.snapshot(), key)
+    except OSError as e:
+        print("The log could not be cached: {}".format(e))
+    return session
+
+class LogCatalog:
+    """
+    Manifest of the logs of a directory
+
+    The directory is scanned with os.scandir, and only the logs that are new
+    or whose size or modification time changed are opened again. For each
+    log, the manifest holds its size, modification time and whether its
+    headers are valid. The list of bosses and the number of players are added
+    the first time they are needed, as they require parsing the log.
+    The manifest is saved as a JSON file in the cache directory
+    """
+    def __init__(self, directory, cache=None):
+        self.directory = os.path.abspath(directory)
+        self.cache = cache
+        digest = hashlib.sha1(
+            self.directory.encode("utf-8", "surrogateescape")).hexdigest()
+        self.manifest = os.path.join(
+            log_cache.CACHE_DIRECTORY, "catalog-{}.json".format(digest))
+        # file name -> size, mtime, valid, bosses and players
+        self.entries = {}
+        try:
+            with open(self.manifest, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == PARSER_VERSION:
+                self.entries = manifest["entries"]
+        except (OSError, ValueError, KeyError):
+            pass
+        self._modified = False
+
+    def update(self):
+        """
+        Scan the directory and bring the manifest up to date
+        """
+        found = set()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not (entry.name.lower().endswith(".csv")
+                        and entry.is_file()):
+                    continue
+                found.add(entry.name)
+                stat = entry.stat()
+                known = self.entries.get(entry.name)
+                if known and (known["size"], known["mtime"]) == \
+                        (stat.st_size, stat.st_mtime_ns):
+                    continue
+                try:
+                    with open(entry.path, newline='') as f:
+                        check_headers(f.readline(), entry.path)
+                    valid = True
+                except LOG_ERRORS:
+                    valid = False
+                self.entries[entry.name] = {
+                    "size": stat.st_size, "mtime": stat.st_mtime_ns,
+                    "valid": valid, "bosses": None, "players": None}
+                self._modified = True
+        for name in set(self.entries) - found:
+            del self.entries[name]
+            self._modified = True
+        self.save()
+        return self
+
+    def describe(self, name):
+        """
+        Add the list of bosses and the number of players of a log
+        """
+        entry = self.entries[name]
+        try:
+            session = open_session(os.path.join(self.directory, name),
+                                   self.cache)
+        except LOG_ERRORS:
+            entry["valid"] = False
+        else:
+            entry["bosses"] = session.bosses
+            entry["players"] = len(session.accounts)
+        self._modified = True
+
+    def save(self):
+        """
+        Write the manifest if it changed
+        """
+        if not self._modified:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.manifest), exist_ok=True)
+            tmp_path = "{}.{}.tmp".format(self.manifest, os.getpid())
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": PARSER_VERSION,
+                           "directory": self.directory,
+                           "entries": self.entries}, f)
+            os.replace(tmp_path, self.manifest)
+            self._modified = False
+        except OSError as e:
+            print("The log catalog could not be saved: {}".format(e))
+
+    def logs(self):
+        """
+        Return the names of the valid logs, from the oldest to the latest
+        """
+        return sorted((name for name, entry in self.entries.items()
+                       if entry["valid"]),
+                      key=lambda name: self.entries[name]["mtime"])
+
+    def latest(self):
+        """
+        Return the name of the most recent valid log, or None
+        """
+        logs = self.logs()
+        return logs[-1] if logs else None
+
+    def with_boss(self, boss_name):
+        """
+        Return the names of the logs containing a given boss, oldest first
+        """
+        for name in self.logs():
+            if self.entries[name]["bosses"] is None:
+                self.describe(name)
+        self.save()
+        return [name for name in self.logs()
+                if boss_name in self.entries[name]["bosses"]]
+
+def find_latest_log(directory="."):
+    """
+    Return the name of the most recent log of a directory, or None
+    """
+    return LogCatalog(directory).update().latest()
+
+class FollowedLog:
+    """
+    State of a log followed by LogFollower
+
+    offset is the number of bytes already parsed, and crc their checksum,
+    used to find out whether the parsed part has been rewritten
+    """
+    def __init__(self, path):
+        self.path = path
+        self.size = None
+        self.mtime = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything parsed so far
+        """
+        self.offset = 0
+        self.crc = 0
+        self.valid = True
+        self.session = LogSession(self.path, LogRows())
+
+    def read(self):
+        """
+        Parse the new content of the log
+
+        Return the set of bosses whose table changed
+        """
+        with open(self.path, "rb") as f:
+            if self.offset:
+                # checking the parsed part is much cheaper than parsing it
+                crc, left = 0, self.offset
+                while left > 0:
+                    chunk = f.read(min(left, 1 << 20))
+                    if not chunk:
+                        break
+                    crc = zlib.crc32(chunk, crc)
+                    left -= len(chunk)
+                if crc != self.crc:
+                    # the log has been exported again: start over
+                    self.reset()
+                    f.seek(0)
+            data = f.read()
+        # an incomplete last line is kept for the next read
+        data = data[:data.rfind(b"\n") + 1]
+        if not data:
+            return set()
+        text = data.decode(locale.getpreferredencoding(False))
+        lines = io.StringIO(text, newline='')
+        if self.offset == 0:
+            try:
+                check_headers(lines.readline(), self.path)
+            except LogFormatError:
+                self.valid = False
+                return set()
+        self.offset += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        return self.session.update(
+            read_lines(lines, self.session.malformed))
+
+class LogFollower:
+    """
+    Follow the logs of a directory while they are written
+
+    The directory is polled with os.stat. Only the logs whose size or
+    modification time changed are read, and only from where the previous read
+    stopped, unless the log has been rewritten
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        # file name -> FollowedLog
+        self.logs = {}
+
+    def poll(self):
+        """
+        Check the directory once
+
+        Return a list of (FollowedLog, set of bosses whose table changed)
+        """
+        updates = []
+        with os.scandir(self.directory) as it:
+            entries = [entry for entry in it
+                       if entry.name.lower().endswith(".csv")
+                       and entry.is_file()]
+        for entry in entries:
+            stat = entry.stat()
+            if entry.name not in self.logs:
+                self.logs[entry.name] = FollowedLog(entry.path)
+            log = self.logs[entry.name]
+            if (log.size, log.mtime) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            if stat.st_size < log.offset or not log.valid:
+                log.reset()
+            log.size, log.mtime = stat.st_size, stat.st_mtime_ns
+            try:
+                changed = log.read()
+            except OSError:
+                # the log is being written, it will be read next time
+                log.size = log.mtime = None
+                continue
+            if changed:
+                updates.append((log, changed))
+        return updates
+
+    def skip_existing(self):
+        """
+        Ignore the logs already in the directory until they change
+        """
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.lower().endswith(".csv") and entry.is_file():
+                    stat = entry.stat()
+                    log = FollowedLog(entry.path)
+                    log.size, log.mtime = stat.st_size, stat.st_mtime_ns
+                    self.logs[entry.name] = log
+
+def follow_logs(directory, interval=1):
+    """
+    Print the tables of the bosses as their logs are exported, until Ctrl+C
+    """
+    follower = LogFollower(directory)
+    follower.skip_existing()
+    print("Following the logs of {}\nHit Ctrl+C to stop\n".format(directory))
+    try:
+        while True:
+            for log, changed in follower.poll():
+                print("Update of log {}".format(os.path.basename(log.path)))
+                for boss_name in sorted(changed, key=find_boss_position):
+                    table = log.session.table(boss_name)
+                    if clipboard:
+                        pyperclip.copy(table)
+                    print()
+                    print(table)
+                print()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+def summarize_log(name):
+    """
+    Parse a log and return its name and snapshot, or None instead of the
+    snapshot if it can't be read
+
+    Used by the worker processes of process_batch
+    """
+    try:
+        # the logs are already parsed in parallel
+        return name, open_session(name, LogCache(), workers=1).snapshot()
+    except LOG_ERRORS:
+        return name, None
+
+def find_logs(pattern):
+    """
+    Return the logs of a directory, or the files matching a glob pattern
+    """
+    if os.path.isdir(pattern):
+        return sorted(os.path.join(pattern, name)
+                      for name in os.listdir(pattern)
+                      if name.lower().endswith(".csv"))
+    return sorted(glob.glob(pattern))
+
+def expand_logs(paths, unmatched=None):
+    """
+    Return the logs given by a list of logs, directories or glob patterns
+
+    See find_logs. If unmatched is given (typically a list), the paths
+    giving no log are added to it
+    """
+    names = []
+    for path in paths:
+        found = [path] if os.path.isfile(path) else find_logs(path)
+        if not found and unmatched is not None:
+            unmatched.append(path)
+        names.extend(found)
+    return names
+
+def process_batch(names, workers=None):
+    """
+    Parse many logs in parallel and merge them into a single session
+
+    Each log is parsed in a worker process, and only its snapshot is sent
+    back. Return the merged session and the list of logs that couldn't be read
+    """
+    # only imported here, as it is slow to import and rarely used
+    from concurrent.futures import ProcessPoolExecutor
+    merged = LogSession("", LogRows())
+    failed = []
+    workers = workers or os.cpu_count() or 1
+    # big enough chunks keep the overhead of the pool low on many small logs
+    chunksize = max(1, len(names) // (4 * workers))
+    with ProcessPoolExecutor(workers) as executor:
+        for name, snapshot in executor.map(summarize_log, names,
+                                           chunksize=chunksize):
+            if snapshot is None:
+                failed.append(name)
+            else:
+                merged.merge(LogSession.from_snapshot(name, snapshot))
+    return merged, failed
+
+def get_boss_names(session):
+    """
+    Get the list of bosses the user is interested in
+    """
+    l_bosses = session.bosses
+    if len(l_bosses) == 1:
+        boss_names = [l_bosses[0]]
         print("Only boss fight found: {}".format(boss_names[0]))
         return boss_names
-    elif len(s_bosses) == 0:
+    elif len(l_bosses) == 0:
         print("That log is empty")
         return []
     else:
-        l_bosses = sorted(list(s_bosses), key=find_boss_position)
         d_names = {k: v for (k, v) in enumerate(l_bosses, 1)}
         print("More than one boss fight is registered in this log.")
         for k, v in d_names.items():
@@ -241,94 +1137,90 @@ def get_boss_names(file):
         print("Processing {}".format(', '.join(boss_names)))
         return boss_names
 
-def process_log(file, boss_name):
+class BossTable:
     """
-    Process a log and return a table made Unicode box characters
+    Content of the table of a given boss, whatever its output format
+
+    It is built once from the BossRecord, and every output format (see
+    FORMATS) is rendered from it. record is the BossRecord of that boss,
+    downs the number of downs of each account and one_boss tells whether the
+    log is about a single boss
     """
-    try:
-        data = load_log(file)
-    except AssertionError:
-        print("The log file isn't correctly formatted")
-        return ""
-    
-    # check whether the was_downed stat can be used
-    s_bosses = set([databit["Boss Name"] for databit in data])-set(["All"])
-    if len(s_bosses) == 1:
-        one_boss = True
-    else:
-        one_boss = False
-    
-    # get the list of mechanics to monitor
-    s_mechanics_f = set()
-    s_mechanics_n = set()
-    for databit in data:
-        if databit["Boss Name"] == boss_name:
-            if databit["Failed"] != "":
-                s_mechanics_f.add(databit["Mechanic Name"])
-            if databit["Neutral"] != "":
-                s_mechanics_n.add(databit["Mechanic Name"])
-    # list of failed mechanics
-    l_mechanics_f = sorted(list(s_mechanics_f))
-    # downs are not relevant if the log is about different boss fights
-    if one_boss:
-        l_mechanics_f.append("was downed")
-    # list of neutral mechanics
-    l_mechanics_n = sorted(list(s_mechanics_n))
+    def __init__(self, record, downs, one_boss):
+        self.boss_name = record.name
+        # list of neutral and failed mechanics
+        self.mechanics_n = sorted(record.mechanics_n)
+        self.mechanics_f = sorted(record.mechanics_f)
+        # downs are not relevant if the log is about different boss fights
+        self.has_downs = one_boss
+        # account name -> character name
+        self.characters = {}
+        # account name -> counts, in the order of columns
+        self.counts = {}
+        columns = self.columns
+        for account_name in sorted(record.players):
+            player = record.players[account_name]
+            self.characters[account_name] = player.get("Player Name")
+            counts = {m: player.get(m, 0) for m in columns}
+            if one_boss and downs.get(account_name) is not None:
+                counts["was downed"] = downs[account_name]
+            self.counts[account_name] = [counts[m] for m in columns]
+
+    @property
+    def failed_columns(self):
+        """
+        Failed mechanics, and the number of downs if relevant
+        """
+        return self.mechanics_f + (["was downed"] if self.has_downs else [])
+
+    @property
+    def columns(self):
+        """
+        Names of the columns following the account name
+        """
+        return self.mechanics_n + self.failed_columns + ["Pulls"]
+
+    def as_dict(self):
+        """
+        Return the content of the table as plain data, with named counts
+        """
+        n_neutral, n_failed = len(self.mechanics_n), len(self.mechanics_f)
+        players = []
+        for account_name, counts in self.counts.items():
+            player = {
+                "account": account_name,
+                "character": self.characters[account_name],
+                "neutral": dict(zip(self.mechanics_n, counts[:n_neutral])),
+                "failed": dict(zip(self.mechanics_f,
+                    counts[n_neutral:n_neutral + n_failed])),
+                "pulls": counts[-1],
+                }
+            if self.has_downs:
+                player["downs"] = counts[-2]
+            players.append(player)
+        return {"boss": self.boss_name, "neutral": self.mechanics_n,
+                "failed": self.mechanics_f, "downs": self.has_downs,
+                "players": players}
+
+def unicode_table_parts(table):
+    """
+    Return the table data of a BossTable, its vertical and horizontal lines,
+    as used by make_table, and the caption of the table
+    """
+    l_mechanics_n = table.mechanics_n
+    l_mechanics_f = table.failed_columns
     # all mechanics and pulls, will make the header of the table
-    l_mechanics = l_mechanics_n + l_mechanics_f + ["Pulls"]
-    
-    
-    # get the list of players
-    l_players = sorted(list(set([databit["Account Name"]
-                                 for databit in data
-                                 if databit["Boss Name"] == boss_name])))
-    # d_players is where the data will be stored before being put in a list
-    d_players = {p: {m: 0 for m in l_mechanics} for p in l_players}
-    # get characters name. Can be used to change the table layout
-    for databit in data:
-        try:
-            d_players[databit["Account Name"]]["Player Name"] = \
-                databit["Player Name"]
-    # if some players joined for another boss, they'll be in the log but not
-    # in l_players. Ignore them
-        except KeyError:
-            pass
-    
-    
-    # fill the player database
-    # pulls, failed and neutral mechanics
-    for databit in data:
-        try:
-            m_name = databit["Mechanic Name"]
-            p_name = databit["Account Name"]
-            if databit["Boss Name"] == boss_name:
-                d_players[p_name]["Pulls"] = int(databit["Pulls"])
-                if m_name in l_mechanics:
-                    if databit["Failed"] != "":
-                        nb = int(databit["Failed"])
-                    elif databit["Neutral"] != "":
-                        nb = int(databit["Neutral"])
-                    d_players[p_name][m_name] = nb
-        except KeyError:
-            pass
-    # number of times downed, if relevant
-    if one_boss:
-        for databit in data:
-            if databit["Boss Name"] == "All":
-                p_name = databit["Account Name"]
-                d_players[p_name]["was downed"] = databit["Downs"]
-    
-    
+    l_mechanics = table.columns
+
     # create the table
     table_data = [["Account Name"] +
                   ["({})".format(i) 
                     for i, m in enumerate(l_mechanics, 1)]]
-    for p in l_players:
-        table_data.append([p.strip(":")] +
-                          [d_players[p][m] for m in l_mechanics])
+    for p, counts in table.counts.items():
+        table_data.append([p.strip(":")] + counts)
     # table formatting
     # horizontal lines
-    h_lines = "02{}2".format((len(l_players)-1)*"0")
+    h_lines = "02{}2".format((len(table.counts)-1)*"0")
     # vertical lines. The account name, neutral mechanics, failed mechanics
     # and pull parts of the table will be separated by a thick line
     if l_mechanics_n != []:
@@ -338,11 +1230,8 @@ def process_log(file, boss_name):
     if l_mechanics_f != []:
         failed_bit = "{}2".format((len(l_mechanics_f)-1)*"1")
     else:
-        print("No failed mechanics")
         failed_bit = ""
     v_lines = "02{}{}2".format(neutral_bit, failed_bit)
-    # create table
-    table = make_table(table_data, v_lines, h_lines)
 
     # caption
     caption = ""
@@ -363,28 +1252,422 @@ def process_log(file, boss_name):
     caption += ("({}): number of attempts" + 
         " (might not be accurate)\n").format(current_index)
     
+    return table_data, v_lines, h_lines, caption
+
+def render_unicode(table):
+    """
+    Return a BossTable made Unicode box characters, in a Discord code block
+    """
+    table_data, v_lines, h_lines, caption = unicode_table_parts(table)
     return "```\nMechanics log for {}:\n\n{}\n{}```".format(
-        boss_name, table, caption)
+        table.boss_name, make_table(table_data, v_lines, h_lines), caption)
+
+def render_json(table):
+    """
+    Return a BossTable as JSON, see BossTable.as_dict
+    """
+    return json.dumps(table.as_dict(), indent=4, ensure_ascii=False)
+
+def render_csv(table):
+    """
+    Return a BossTable as csv, with a line per account
+    """
+    f = io.StringIO()
+    writer = csv.writer(f, lineterminator="\n")
+    writer.writerow(["Account Name", "Player Name"] + table.columns)
+    for account_name, counts in table.counts.items():
+        writer.writerow([account_name, table.characters[account_name]] +
+                        counts)
+    return f.getvalue()
+
+def render_markdown(table):
+    """
+    Return a BossTable as a GitHub Markdown table, with the mechanic names as
+    headers
+    """
+    def cell(value):
+        return str(value).replace("|", "\\|")
+    columns = ["Account Name"] + table.columns
+    lines = ["### Mechanics log for {}".format(table.boss_name), "",
+             "| " + " | ".join(cell(c) for c in columns) + " |",
+             "| --- |" + " ---: |" * (len(columns) - 1)]
+    for account_name, counts in table.counts.items():
+        lines.append("| " + " | ".join(
+            cell(c) for c in [account_name.strip(":")] + counts) + " |")
+    return "\n".join(lines) + "\n"
+
+# output format -> file extension and renderer of a BossTable
+FORMATS = {
+    "unicode": (".txt", render_unicode),
+    "json": (".json", render_json),
+    "csv": (".csv", render_csv),
+    "markdown": (".md", render_markdown),
+    }
+
+def make_boss_table(record, downs, one_boss):
+    """
+    Return a table made Unicode box characters for a given boss
+
+    See BossTable for the parameters, and unicode_table_parts for the
+    content of the table
+    """
+    return render_unicode(BossTable(record, downs, one_boss))
+
+def split_text(text, max_chars):
+    """
+    Split a text in parts of at most max_chars characters, between lines
+    """
+    parts, part = [], ""
+    for line in text.splitlines(True):
+        if part and len(part) + len(line) > max_chars:
+            parts.append(part)
+            part = ""
+        part += line
+    if part:
+        parts.append(part)
+    return parts
+
+def table_pages(table, max_chars=DISCORD_LIMIT):
+    """
+    Yield a BossTable as messages of at most max_chars characters
+
+    A table that fits is yielded as render_unicode returns it. Otherwise it
+    is split between groups of players, each page repeating the header of
+    the table and its caption. If the caption is too long to be repeated, it
+    gets its own messages, and if not even a single player fits with the
+    header, the table is split between any of its lines. The pages are only
+    drawn when they are reached. Raise a ValueError if a line of the table
+    is too long for a message
+    """
+    table_data, v_lines, h_lines, caption = unicode_table_parts(table)
+    boss_name = table.boss_name
+    message = "```\nMechanics log for {}{}:\n\n{}\n{}```"
+    # size of a message without the table, with the longest page numbers
+    suffix = " ({0}/{0})".format(len(table_data) + len(caption))
+    size = len(message.format(boss_name, suffix, "", caption))
+    try:
+        n_pages, pages = paginate_table(table_data, v_lines, h_lines,
+            max_chars - size + len(suffix))
+        if n_pages == 1:
+            yield message.format(boss_name, "", next(pages), caption)
+            return
+        n_pages, pages = paginate_table(table_data, v_lines, h_lines,
+            max_chars - size)
+        captions = []
+    except ValueError:
+        # the caption leaves no room for the table: it is sent on its own
+        captions = split_text(caption, max_chars - len("```\n```"))
+        size = len(message.format(boss_name, suffix, "", ""))
+        try:
+            n_pages, pages = paginate_table(table_data, v_lines, h_lines,
+                max_chars - size)
+        except ValueError:
+            # not even a single player fits with the header: the whole table
+            # is split between its lines
+            budget = max_chars - len("```\n```")
+            parts = split_text("Mechanics log for {}:\n\n{}\n{}".format(
+                boss_name, make_table(table_data, v_lines, h_lines),
+                caption), budget)
+            if any(len(part) > budget for part in parts):
+                raise ValueError("{} characters are too few for a line of " \
+                    "the table of {}".format(max_chars, boss_name)) from None
+            for part in parts:
+                yield "```\n{}```".format(part)
+            return
+        caption = ""
+    n_pages += len(captions)
+    for i, page in enumerate(pages, 1):
+        yield message.format(boss_name, " ({}/{})".format(i, n_pages),
+                             page, caption)
+    for part in captions:
+        yield "```\n{}```".format(part)
+
+def render_ahead(session, boss_names, max_chars=DISCORD_LIMIT):
+    """
+    Start rendering the messages of the given bosses in the background
+
+    A thread renders every page of every boss, in order, while the messages
+    already rendered are used. Return an iterator yielding the messages as
+    soon as each one is ready. An error raised while rendering is raised by
+    the iterator
+    """
+    # only imported here, as they are only needed by the interactive mode
+    import queue
+    import threading
+    messages = queue.Queue()
+    def render():
+        try:
+            for boss_name in boss_names:
+                with stage("render"):
+                    for page in session.pages(boss_name, max_chars):
+                        messages.put(page)
+        except Exception as e:
+            messages.put(e)
+        else:
+            messages.put(None)
+    def rendered():
+        while True:
+            message = messages.get()
+            if message is None:
+                return
+            if isinstance(message, Exception):
+                raise message
+            yield message
+    # the thread doesn't keep the script open once the user is done
+    threading.Thread(target=render, daemon=True).start()
+    return rendered()
+
+def process_log(file, boss_name, formats=None):
+    """
+    Process a log and return a table made Unicode box characters
+
+    file is either the name of a log, a LogRows store or a LogSession already
+    loaded. If formats is given (see FORMATS), return a dict format -> table
+    instead, all of them built from a single BossTable
+    """
+    try:
+        with stage("parse") as s:
+            if isinstance(file, LogSession):
+                session = file
+            elif isinstance(file, LogRows):
+                session = LogSession("", file)
+            else:
+                session = LogSession(file)
+            s.rows = session.n_rows
+    except LogFormatError:
+        print("The log file isn't correctly formatted")
+        return "" if formats is None else {fmt: "" for fmt in formats}
+    with stage("render"):
+        if formats is not None:
+            return session.export(boss_name, formats)
+        return session.table(boss_name)
+
+def table_file_name(log_name, boss_name, extension=".txt"):
+    """
+    Return the name of the file holding the table of a boss, see export_tables
+    """
+    stem = os.path.splitext(os.path.basename(log_name))[0]
+    name = "{} - {}{}".format(stem, boss_name, extension)
+    # characters that can't be used in Windows file names
+    return "".join("_" if c in '<>:"/\\|?*' else c for c in name)
+
+def write_atomically(path, content):
+    """
+    Write a file through a temporary file, so it is never half written
+
+    content is the text of the file, or a function writing it, called with
+    the temporary file opened in binary mode
+    """
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        if callable(content):
+            with open(tmp_path, "wb") as f:
+                content(f)
+        else:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def select_bosses(session, boss_names=None):
+    """
+    Return the bosses of a session among the given names, case ignored
+
+    All of them are returned if boss_names is None
+    """
+    if boss_names is None:
+        return session.bosses
+    boss_names = {boss_name.lower() for boss_name in boss_names}
+    return [boss_name for boss_name in session.bosses
+            if boss_name.lower() in boss_names]
+
+def export_tables(names, boss_names=None, directory=None, stdout=False,
+                  max_chars=DISCORD_LIMIT, cache=None, formats=("unicode",),
+                  unmatched=None):
+    """
+    Render the tables of logs without asking anything
+
+    Each log is parsed once, and the tables of the selected bosses (all of
+    them if boss_names is None, case is ignored) are built from it, in the
+    given formats (see FORMATS). Unicode tables are split in messages like in
+    the script, see table_pages. The tables are written in directory, one
+    file per log, boss and format named by table_file_name, and printed if
+    stdout is True. If unmatched is given (typically a list), the names of
+    boss_names matching no boss of the logs read are added to it.
+    Return the list of the logs that couldn't be read
+    """
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    failed = []
+    # lowercase names of the bosses found in the logs
+    found = set()
+    for name in names:
+        try:
+            session = open_session(name, cache)
+        except LOG_ERRORS:
+            failed.append(name)
+            continue
+        for boss_name in select_bosses(session, boss_names):
+            found.add(boss_name.lower())
+            with stage("render"):
+                table = session.boss_table(boss_name)
+                texts = {}
+                for fmt in formats:
+                    if fmt == "unicode" and max_chars:
+                        texts[fmt] = "\n\n".join(
+                            table_pages(table, max_chars)) + "\n"
+                    else:
+                        texts[fmt] = FORMATS[fmt][1](table).rstrip("\n") + \
+                            "\n"
+            for fmt, text in texts.items():
+                if directory is not None:
+                    write_atomically(os.path.join(directory, table_file_name(
+                        name, boss_name, FORMATS[fmt][0])), text)
+                if stdout:
+                    print(text)
+    if unmatched is not None and boss_names is not None:
+        unmatched.extend(boss_name for boss_name in boss_names
+                         if boss_name.lower() not in found)
+    return failed
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Parse the Martion " +
+        "Laboratories mechanics log into a Discord-friendly table")
+    parser.add_argument("log", nargs="*",
+        help="log to parse. If missing, the script asks for it. With " +
+        "--output or --stdout, any number of logs, directories of logs or " +
+        "glob patterns")
+    parser.add_argument("--output", metavar="DIRECTORY",
+        help="write the tables of the logs in a directory, one file per " +
+        "boss, without asking anything")
+    parser.add_argument("--stdout", action="store_true",
+        help="print the tables of the logs without asking anything")
+    parser.add_argument("--format", default="unicode",
+        help="with --output or --stdout, comma separated output formats, " +
+        "among {} (default: %(default)s)".format(", ".join(FORMATS)))
+    parser.add_argument("--boss", action="append",
+        help="with --output or --stdout, only build the table of that boss " +
+        "(can be repeated, default: every boss)")
+    parser.add_argument("--follow", action="store_true",
+        help="watch the log directory and print the tables of the bosses " +
+        "each time their log is exported")
+    parser.add_argument("--with-boss", metavar="BOSS",
+        help="list the logs of the log directory containing a given boss")
+    parser.add_argument("--batch", metavar="PATH",
+        help="merge all the logs of a directory, or matching a glob " +
+        "pattern, and print the tables of every boss")
+    parser.add_argument("--workers", type=int,
+        help="number of processes used by --batch and to parse logs of " +
+        "more than 32 MB (default: one per core)")
+    parser.add_argument("--max-chars", type=int, default=DISCORD_LIMIT,
+        help="maximum size of a message. Longer tables are split between " +
+        "players (default: %(default)s, 0 to never split)")
+    parser.add_argument("--profile", action="store_true",
+        help="print the time, rows and memory peak of each stage")
+    parser.add_argument("--profile-json", metavar="FILE",
+        help="also save these measurements as JSON (implies --profile)")
+    parser.add_argument("--profile-dump", metavar="FILE",
+        help="also save the cProfile statistics of the slowest stage, to " +
+        "be read with pstats or snakeviz (implies --profile)")
+    args = parser.parse_args()
+    if args.profile or args.profile_json or args.profile_dump:
+        profiler.enable(cprofile=args.profile_dump is not None)
+    if args.output or args.stdout:
+        if not args.log:
+            parser.error("logs are needed with --output or --stdout")
+        missing_logs, missing_bosses = [], []
+        names = expand_logs(args.log, missing_logs)
+        formats = [fmt.strip().lower() for fmt in args.format.split(",")]
+        for fmt in formats:
+            if fmt not in FORMATS:
+                parser.error("unknown format {}".format(fmt))
+        try:
+            failed = export_tables(names, args.boss, args.output,
+                                   args.stdout, args.max_chars, LogCache(),
+                                   formats, missing_bosses)
+        except ValueError as e:
+            # --max-chars is too small for the tables
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        for path in missing_logs:
+            print("{} matches no log".format(path), file=sys.stderr)
+        for name in failed:
+            print("{} could not be read".format(name), file=sys.stderr)
+        for boss_name in missing_bosses:
+            print("No log has a boss named {}".format(boss_name),
+                  file=sys.stderr)
+        profiler.print_report(args.profile_json, args.profile_dump)
+        sys.exit(1 if missing_logs or failed or missing_bosses else 0)
+    if len(args.log) > 1:
+        parser.error("only one log can be parsed without --output or --stdout")
+    load_cli()
+    if args.batch:
+        names = find_logs(args.batch)
+        start = time.perf_counter()
+        with stage("batch") as s:
+            session, failed = process_batch(names, args.workers)
+            s.rows = session.n_rows
+        duration = max(time.perf_counter() - start, 1e-9)
+        for name in failed:
+            print("{} could not be read".format(name))
+        print("Processed {} logs ({} lines) in {:.2f}s: ".format(
+            len(names) - len(failed), session.n_rows, duration) +
+            "{:.1f} files/s, {:.0f} lines/s".format(
+            len(names) / duration, session.n_rows / duration))
+        for boss_name in session.bosses:
+            with stage("render"):
+                table = session.table(boss_name)
+            print()
+            print(table)
+        profiler.print_report(args.profile_json, args.profile_dump)
+        sys.exit(1 if failed else 0)
+    if args.follow:
+        follow_logs(get_log_directory())
+        sys.exit()
+    if args.with_boss:
+        catalog = LogCatalog(get_log_directory(), LogCache()).update()
+        for name in catalog.with_boss(args.with_boss):
+            entry = catalog.entries[name]
+            print("{}: {} players, {}".format(
+                name, entry["players"], ", ".join(entry["bosses"])))
+        sys.exit()
+
     # get the name of the file to process
-    if len(sys.argv) == 1:
+    if not args.log:
         dir = get_log_directory()
         os.chdir(dir)
         log = input("Type the name of the file to parse" +
         " (including the .csv, but the directory\nisn't needed)." + 
         " If empty, the script will parse the most recent log.\n> ")
         if log == "":
-            log = find_latest_log()
+            with stage("find latest log"):
+                log = find_latest_log()
         if log not in os.listdir():
             input("File could not be found")
             raise ValueError("Wrong filename")
     else:
-        log = sys.argv[1]
+        log = args.log[0]
     print("Processing log {}\n".format(log))
     
-    # process bosses and display
-    boss_names = get_boss_names(log)
+    # load the log once, then process bosses and display
+    try:
+        session = open_session(log, LogCache(), args.workers)
+    except LogFormatError:
+        print("The log file isn't correctly formatted")
+        session = None
+    if session and session.malformed:
+        print("{} malformed lines were ignored".format(
+            sum(session.malformed.values())))
+    boss_names = get_boss_names(session) if session else []
+    for boss_name in boss_names:
+        if not session.boss_table(boss_name).failed_columns:
+            print("No failed mechanics for {}".format(boss_name))
     print()
     if not clipboard:
         print("Reminder: right-clicking in a Windows terminal copies" + 
@@ -393,15 +1676,27 @@ if __name__ == "__main__":
         print("To move to the next log processing, press and release the" + 
             " V key\n(pasting using ctrl+V in Discord triggers it, but" +
             " the key can be\nmodified in mechanics_log_settings.ini)")
-    while boss_names:
-        table = process_log(log, boss_names.pop(0))
-        if clipboard:
-            pyperclip.copy(table)
-        print()
-        print(table)
-        if boss_names:
-            hold_script()
+    # tables too long for a single message are split in several ones. They
+    # are all rendered in the background, while the first ones are pasted
+    messages = render_ahead(session, boss_names, args.max_chars)
+    try:
+        with stage("wait for render"):
+            message = next(messages, None)
+        while message is not None:
+            if clipboard:
+                with stage("clipboard"):
+                    pyperclip.copy(message)
             print()
+            print(message)
+            with stage("wait for render"):
+                message = next(messages, None)
+            if message is not None:
+                hold_script()
+                print()
+    except ValueError as e:
+        # --max-chars is too small for the table
+        print(e)
+    profiler.print_report(args.profile_json, args.profile_dump)
     input("Hit return to close")
 
 
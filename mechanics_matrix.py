@@ -0,0 +1,498 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Account × mechanic matrices of many logs, for statistics over a season
+
+The names of the logs are coded as integer ids: accounts, bosses, and the
+columns of the matrices, which are (boss, mechanic) pairs. The counts of every
+log are then added to dense accounts × columns matrices, along with accounts ×
+bosses matrices of pulls. The tables of the bosses, the same as LogSession
+would build from the merged logs, and statistics over the whole season
+(totals, counts per pull, percentiles and rankings) are derived from them.
+
+NumPy is used when it is installed: the ids of the lines of a log are found
+with numpy.unique and the counts added with numpy.bincount. Without it, the
+same matrices are built as lists, with the same results.
+
+    python mechanics_matrix.py logs --top 10
+"""
+
+import argparse
+import math
+
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+from mechanics_log import (HEADERS, LOG_ERRORS, BossRecord, LogRows,
+                           expand_logs, find_boss_position, make_boss_table,
+                           open_session)
+from log_cache import LogCache
+from Unicode_table import make_table
+
+def percentile(values, q):
+    """
+    Return the q-th percentile of a list of numbers
+
+    Values are interpolated linearly, exactly as numpy.percentile does
+    """
+    values = sorted(values)
+    index = (len(values) - 1) * (q / 100)
+    lo = math.floor(index)
+    hi = min(lo + 1, len(values) - 1)
+    t = index - lo
+    a, b = values[lo], values[hi]
+    # numpy interpolates from the closest value, for the sake of precision
+    if t < 0.5:
+        return a + (b - a) * t
+    return b - (b - a) * (1 - t)
+
+class MechanicsMatrix:
+    """
+    Counts of many logs, as accounts × (boss, mechanic) matrices
+
+    Logs are added with add_rows or add_session, and the matrices are built
+    when they are first needed. use_numpy chooses the backend: NumPy if it
+    is installed, unless it is False
+    """
+    def __init__(self, use_numpy=None):
+        if use_numpy and numpy is None:
+            raise ModuleNotFoundError("NumPy isn't installed")
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        # id -> name, and name -> id
+        self.accounts, self.account_ids = [], {}
+        self.bosses, self.boss_ids = [], {}
+        # id -> (boss name, mechanic name)
+        self.columns, self.column_ids = [], {}
+        # (account id, boss id) -> character name
+        self.characters = {}
+        # account id -> summed downs, for the accounts whose downs are known
+        self.downs = {}
+        self.n_logs = 0
+        # counts of each log: account ids, column ids, failed and neutral
+        # counts (-1 if empty). Only the last count of a cell is kept, as in a
+        # LogSession
+        self._counts = []
+        # pulls of each log: account ids, boss ids, pulls
+        self._pulls = []
+        self._matrices = None
+
+    @staticmethod
+    def _id(name, names, ids):
+        """
+        Return the id of a name, adding it to the names if needed
+        """
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        return ids[name]
+
+    def add_rows(self, rows):
+        """
+        Add the lines of a log, as a LogRows store
+        """
+        self.n_logs += 1
+        self._matrices = None
+        names, empty = rows.names, rows.EMPTY
+        all_code = rows.codes.get("All")
+        columns = [rows.columns[key] for key in HEADERS]
+        if self.use_numpy:
+            self._add_rows_numpy(names, empty, all_code, columns)
+        else:
+            self._add_rows_lists(names, empty, all_code, columns)
+
+    def _add_rows_lists(self, names, empty, all_code, columns):
+        """
+        add_rows, without NumPy
+        """
+        # (account id, column id) -> failed and neutral counts
+        cells = {}
+        # (account id, boss id) -> pulls
+        pulls = {}
+        downs = {}
+        for p, a, b, m, n, f, d, _, pu in zip(*columns):
+            a_id = self._id(names[a], self.accounts, self.account_ids)
+            if b == all_code:
+                downs[a_id] = d
+                continue
+            b_id = self._id(names[b], self.bosses, self.boss_ids)
+            if f >= 0 or n >= 0:
+                cells[a_id, self._id((names[b], names[m]), self.columns,
+                                     self.column_ids)] = (f, n)
+            pulls[a_id, b_id] = max(pulls.get((a_id, b_id), empty), pu)
+            self.characters[a_id, b_id] = names[p]
+        self._counts.append((
+            [a_id for a_id, _ in cells], [c_id for _, c_id in cells],
+            [f for f, _ in cells.values()], [n for _, n in cells.values()]))
+        self._pulls.append((
+            [a_id for a_id, _ in pulls], [b_id for _, b_id in pulls],
+            list(pulls.values())))
+        self._add_downs(downs, empty)
+
+    def _add_rows_numpy(self, names, empty, all_code, columns):
+        """
+        add_rows, with NumPy
+        """
+        p, a, b, m, n, f, d, _, pu = [
+            numpy.frombuffer(column, dtype=numpy.int32).astype(numpy.int64)
+            for column in columns]
+        n_names = len(names)
+        # local name code -> account id
+        a_codes, a_inverse = numpy.unique(a, return_inverse=True)
+        a_map = numpy.array([self._id(names[code], self.accounts,
+                                      self.account_ids)
+                             for code in a_codes.tolist()], dtype=numpy.int64)
+        a_ids = a_map[a_inverse.reshape(-1)]
+        is_all = b == all_code if all_code is not None else \
+            numpy.zeros(len(b), dtype=bool)
+        # the downs of the "All" lines. Only the last one of an account counts
+        downs = dict(zip(a_ids[is_all].tolist(), d[is_all].tolist()))
+        keep = ~is_all
+        p, a_ids, b, m, n, f, pu = \
+            p[keep], a_ids[keep], b[keep], m[keep], n[keep], f[keep], pu[keep]
+        b_codes, b_inverse = numpy.unique(b, return_inverse=True)
+        b_map = numpy.array([self._id(names[code], self.bosses, self.boss_ids)
+                             for code in b_codes.tolist()], dtype=numpy.int64)
+        b_ids = b_map[b_inverse.reshape(-1)]
+        # columns are (boss, mechanic) pairs
+        pair_codes, pair_inverse = numpy.unique(b * n_names + m,
+                                                return_inverse=True)
+        pair_map = numpy.array(
+            [self._id((names[code // n_names], names[code % n_names]),
+                      self.columns, self.column_ids)
+             for code in pair_codes.tolist()], dtype=numpy.int64)
+        col_ids = pair_map[pair_inverse.reshape(-1)]
+        # like in a LogSession, the last count of a cell replaces the others
+        rows = numpy.flatnonzero((f >= 0) | (n >= 0))
+        cells = a_ids[rows] * len(self.columns) + col_ids[rows]
+        _, first = numpy.unique(cells[::-1], return_index=True)
+        rows = rows[len(rows) - 1 - first]
+        self._counts.append((a_ids[rows], col_ids[rows], f[rows], n[rows]))
+        # highest pulls and last character of each (account, boss) pair
+        n_bosses = len(self.bosses)
+        keys = a_ids * n_bosses + b_ids
+        key_codes, key_inverse = numpy.unique(keys, return_inverse=True)
+        key_inverse = key_inverse.reshape(-1)
+        key_pulls = numpy.full(len(key_codes), empty, dtype=numpy.int64)
+        numpy.maximum.at(key_pulls, key_inverse, pu)
+        last = numpy.zeros(len(key_codes), dtype=numpy.int64)
+        numpy.maximum.at(last, key_inverse, numpy.arange(len(keys)))
+        for key, code in zip(key_codes.tolist(), p[last].tolist()):
+            self.characters[divmod(key, n_bosses)] = names[code]
+        self._pulls.append((key_codes // n_bosses, key_codes % n_bosses,
+                            key_pulls))
+        self._add_downs(downs, empty)
+
+    def _add_downs(self, downs, empty):
+        """
+        Add the downs of a log, given as account id -> downs
+        """
+        for a_id, nb in downs.items():
+            if nb != empty:
+                self.downs[a_id] = self.downs.get(a_id, 0) + nb
+
+    def add_session(self, session):
+        """
+        Add a LogSession, for example loaded from the cache
+        """
+        rows = LogRows()
+        for boss_name, record in session.records.items():
+            for account_name, counts in record.players.items():
+                pulls = counts.get("Pulls")
+                player_name = counts.get("Player Name")
+                rows.append([player_name, account_name, boss_name, "",
+                             None, None, None, None, pulls])
+                for m_name in record.mechanics_f | record.mechanics_n:
+                    if m_name in counts:
+                        failed = m_name in record.mechanics_f
+                        rows.append([
+                            player_name, account_name, boss_name, m_name,
+                            None if failed else counts[m_name],
+                            counts[m_name] if failed else None, None, None,
+                            pulls])
+        for account_name, nb in session.downs.items():
+            rows.append(["", account_name, "All", "", None, None, nb, None,
+                         None])
+        self.add_rows(rows)
+
+    def matrices(self):
+        """
+        Return the matrices, building them if needed
+
+        They are a dict of NumPy arrays, or of lists of lists:
+        ♦ failed and neutral: accounts × columns counts
+        ♦ has_failed and has_neutral: accounts × columns, whether a count is
+        known
+        ♦ pulls and attended: accounts × bosses, the pulls and whether the
+        account fought that boss
+        ♦ column_boss: boss id of each column
+        """
+        if self._matrices is None:
+            if self.use_numpy:
+                self._matrices = self._build_numpy()
+            else:
+                self._matrices = self._build_lists()
+        return self._matrices
+
+    def _build_lists(self):
+        """
+        matrices, without NumPy
+        """
+        n_acc, n_col, n_boss = \
+            len(self.accounts), len(self.columns), len(self.bosses)
+        mat = {key: [[0] * n_col for _ in range(n_acc)]
+               for key in ("failed", "neutral")}
+        mat.update({key: [[False] * n_col for _ in range(n_acc)]
+                    for key in ("has_failed", "has_neutral")})
+        mat["pulls"] = [[0] * n_boss for _ in range(n_acc)]
+        mat["attended"] = [[False] * n_boss for _ in range(n_acc)]
+        for acc_ids, col_ids, failed, neutral in self._counts:
+            for a_id, c_id, f, n in zip(acc_ids, col_ids, failed, neutral):
+                if f >= 0:
+                    mat["failed"][a_id][c_id] += f
+                    mat["has_failed"][a_id][c_id] = True
+                elif n >= 0:
+                    mat["neutral"][a_id][c_id] += n
+                    mat["has_neutral"][a_id][c_id] = True
+        for acc_ids, boss_ids, pulls in self._pulls:
+            for a_id, b_id, pu in zip(acc_ids, boss_ids, pulls):
+                mat["pulls"][a_id][b_id] += max(pu, 0)
+                mat["attended"][a_id][b_id] = True
+        mat["column_boss"] = [self.boss_ids[boss_name]
+                              for boss_name, _ in self.columns]
+        return mat
+
+    def _build_numpy(self):
+        """
+        matrices, with NumPy
+        """
+        n_acc, n_col, n_boss = \
+            len(self.accounts), len(self.columns), len(self.bosses)
+        mat = {}
+        if self._counts:
+            acc_ids, col_ids, failed, neutral = [
+                numpy.concatenate([numpy.asarray(block[i], dtype=numpy.int64)
+                                   for block in self._counts])
+                for i in range(4)]
+        else:
+            acc_ids = col_ids = failed = neutral = \
+                numpy.zeros(0, dtype=numpy.int64)
+        cells = acc_ids * n_col + col_ids
+        is_failed = failed >= 0
+        is_neutral = ~is_failed & (neutral >= 0)
+        for key, mask, counts in (("failed", is_failed, failed),
+                                  ("neutral", is_neutral, neutral)):
+            # the weights are floats, exact for any realistic count
+            mat[key] = numpy.bincount(
+                cells[mask], weights=counts[mask], minlength=n_acc * n_col
+                ).round().astype(numpy.int64).reshape(n_acc, n_col)
+            has = numpy.zeros(n_acc * n_col, dtype=bool)
+            has[cells[mask]] = True
+            mat["has_" + key] = has.reshape(n_acc, n_col)
+        mat["pulls"] = numpy.zeros((n_acc, n_boss), dtype=numpy.int64)
+        mat["attended"] = numpy.zeros((n_acc, n_boss), dtype=bool)
+        for acc_ids, boss_ids, pulls in self._pulls:
+            numpy.add.at(mat["pulls"], (acc_ids, boss_ids),
+                         numpy.maximum(pulls, 0))
+            mat["attended"][acc_ids, boss_ids] = True
+        mat["column_boss"] = numpy.array(
+            [self.boss_ids[boss_name] for boss_name, _ in self.columns],
+            dtype=numpy.int64)
+        return mat
+
+    def _boss_part(self, boss_name):
+        """
+        Return the part of the matrices about a boss, as lists
+
+        Return the ids of the accounts having fought that boss and of the
+        columns of the boss, and for each of these accounts, its pulls and
+        its failed, neutral, has_failed and has_neutral rows
+        """
+        mat = self.matrices()
+        b_id = self.boss_ids[boss_name]
+        if self.use_numpy:
+            accs = numpy.flatnonzero(mat["attended"][:, b_id])
+            cols = numpy.flatnonzero(mat["column_boss"] == b_id)
+            part = [mat[key][numpy.ix_(accs, cols)].tolist()
+                    for key in ("failed", "neutral", "has_failed",
+                                "has_neutral")]
+            return (accs.tolist(), cols.tolist(),
+                    mat["pulls"][accs, b_id].tolist(), *part)
+        accs = [a_id for a_id in range(len(self.accounts))
+                if mat["attended"][a_id][b_id]]
+        cols = [c_id for c_id, c_boss in enumerate(mat["column_boss"])
+                if c_boss == b_id]
+        part = [[[mat[key][a_id][c_id] for c_id in cols] for a_id in accs]
+                for key in ("failed", "neutral", "has_failed", "has_neutral")]
+        return (accs, cols, [mat["pulls"][a_id][b_id] for a_id in accs],
+                *part)
+
+    def record(self, boss_name):
+        """
+        Return the BossRecord of a boss, with the counts of every log
+        """
+        record = BossRecord(boss_name)
+        if boss_name not in self.boss_ids:
+            return record
+        b_id = self.boss_ids[boss_name]
+        accs, cols, pulls, failed, neutral, has_failed, has_neutral = \
+            self._boss_part(boss_name)
+        for i, a_id in enumerate(accs):
+            player = {"Player Name": self.characters.get((a_id, b_id))}
+            if pulls[i]:
+                player["Pulls"] = pulls[i]
+            for j, c_id in enumerate(cols):
+                m_name = self.columns[c_id][1]
+                if has_failed[i][j]:
+                    record.mechanics_f.add(m_name)
+                    player[m_name] = failed[i][j]
+                elif has_neutral[i][j]:
+                    record.mechanics_n.add(m_name)
+                    player[m_name] = neutral[i][j]
+            record.players[self.accounts[a_id]] = player
+        return record
+
+    @property
+    def one_boss(self):
+        """
+        Whether the was_downed stat can be used, as in LogSession
+        """
+        return len(self.bosses) == 1
+
+    def table(self, boss_name):
+        """
+        Return the table of a boss, as LogSession.table does
+        """
+        downs = {self.accounts[a_id]: nb for a_id, nb in self.downs.items()}
+        return make_boss_table(self.record(boss_name), downs, self.one_boss)
+
+    def totals(self, boss_name=None):
+        """
+        Return the failed and neutral counts and the pulls of every account
+
+        The counts are summed over every boss, or only cover a given boss.
+        Return a dict account name -> (failed, neutral, pulls), for the
+        accounts having fought these bosses
+        """
+        mat = self.matrices()
+        if self.use_numpy:
+            if boss_name is None:
+                cols = slice(None)
+                pulls = mat["pulls"].sum(axis=1)
+                attended = mat["attended"].any(axis=1)
+            else:
+                b_id = self.boss_ids.get(boss_name, -1)
+                cols = mat["column_boss"] == b_id
+                pulls = mat["pulls"][:, b_id] if b_id >= 0 else \
+                    numpy.zeros(len(self.accounts), dtype=numpy.int64)
+                attended = mat["attended"][:, b_id] if b_id >= 0 else \
+                    numpy.zeros(len(self.accounts), dtype=bool)
+            failed = mat["failed"][:, cols].sum(axis=1)
+            neutral = mat["neutral"][:, cols].sum(axis=1)
+            return {self.accounts[a_id]: (f, n, pu) for a_id, f, n, pu in zip(
+                numpy.flatnonzero(attended).tolist(),
+                failed[attended].tolist(), neutral[attended].tolist(),
+                pulls[attended].tolist())}
+        b_id = None if boss_name is None else self.boss_ids.get(boss_name, -1)
+        cols = [c_id for c_id, c_boss in enumerate(mat["column_boss"])
+                if b_id is None or c_boss == b_id]
+        totals = {}
+        for a_id, account_name in enumerate(self.accounts):
+            if b_id is None:
+                if not any(mat["attended"][a_id]):
+                    continue
+                pulls = sum(mat["pulls"][a_id])
+            elif b_id < 0 or not mat["attended"][a_id][b_id]:
+                continue
+            else:
+                pulls = mat["pulls"][a_id][b_id]
+            totals[account_name] = (
+                sum(mat["failed"][a_id][c_id] for c_id in cols),
+                sum(mat["neutral"][a_id][c_id] for c_id in cols), pulls)
+        return totals
+
+    def per_pull(self, boss_name=None):
+        """
+        Return the failed mechanics per pull of every account, see totals
+        """
+        return {account_name: failed / pulls for account_name,
+                (failed, _, pulls) in self.totals(boss_name).items() if pulls}
+
+    def ranking(self, boss_name=None, top=None):
+        """
+        Return (account name, failed mechanics per pull) pairs, worst first
+
+        Only the top first ones are returned if top is given
+        """
+        ranking = sorted(self.per_pull(boss_name).items(),
+                         key=lambda item: (-item[1], item[0]))
+        return ranking if top is None else ranking[:top]
+
+    def percentiles(self, q, boss_name=None):
+        """
+        Return the q-th percentile of the counts per pull of each mechanic
+
+        For each (boss, mechanic) column, the percentile is taken over the
+        accounts that fought the boss. Return a dict (boss name, mechanic
+        name) -> percentile
+        """
+        b_ids = range(len(self.bosses)) if boss_name is None else \
+            [self.boss_ids[boss_name]] if boss_name in self.boss_ids else []
+        result = {}
+        for b_id in b_ids:
+            accs, cols, pulls, failed, neutral, has_failed, has_neutral = \
+                self._boss_part(self.bosses[b_id])
+            accs = [i for i, pu in enumerate(pulls) if pu]
+            if not accs:
+                continue
+            # columns without any count only hold accounts that were there
+            cols = [(j, c_id) for j, c_id in enumerate(cols) if any(
+                has_failed[i][j] or has_neutral[i][j] for i in accs)]
+            if self.use_numpy:
+                counts = numpy.where(has_failed, failed, neutral)[accs]
+                values = counts / numpy.array(pulls)[accs, None]
+                for j, c_id in cols:
+                    result[self.columns[c_id]] = float(
+                        numpy.percentile(values[:, j], q))
+                continue
+            for j, c_id in cols:
+                result[self.columns[c_id]] = percentile(
+                    [(failed[i][j] if has_failed[i][j] else neutral[i][j]) /
+                     pulls[i] for i in accs], q)
+        return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rank the accounts over many logs")
+    parser.add_argument("logs", nargs="+",
+        help="logs, directories of logs or glob patterns")
+    parser.add_argument("--boss",
+        help="only use the fights against that boss")
+    parser.add_argument("--top", type=int,
+        help="only show the TOP accounts with the most failed mechanics")
+    parser.add_argument("--no-numpy", action="store_true",
+        help="don't use NumPy, even if it is installed")
+    args = parser.parse_args()
+
+    matrix = MechanicsMatrix(False if args.no_numpy else None)
+    cache = LogCache()
+    for name in expand_logs(args.logs):
+        try:
+            matrix.add_session(open_session(name, cache))
+        except LOG_ERRORS:
+            print("{} could not be read".format(name))
+    totals = matrix.totals(args.boss)
+    data = [["Account Name", "Failed", "Neutral", "Pulls", "Failed/pull"]]
+    for account_name, rate in matrix.ranking(args.boss, args.top):
+        failed, neutral, pulls = totals[account_name]
+        data.append([account_name.strip(":"), failed, neutral, pulls,
+                     "{:.2f}".format(rate)])
+    print("{} logs, {}, {} accounts".format(
+        matrix.n_logs, args.boss or ", ".join(
+            sorted(matrix.bosses, key=find_boss_position)), len(totals)))
+    if len(data) > 1:
+        print(make_table(data, "021112", "02" + "0" * (len(data) - 2) + "2"))
+    else:
+        print("No result")
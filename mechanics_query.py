@@ -0,0 +1,185 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Answer questions about the mechanics of one or many logs
+
+A query goes through the counts of a LogSession, keeping those matching its
+filters: boss, account, mechanic, type of mechanic (failed or neutral) and
+minimum count. The counts can be grouped by account, by account and boss, or
+kept for each mechanic. The results are sorted by any column, and only the
+top ones are selected, using a heap, before being drawn with make_table.
+For example, the 5 players with the most failed mechanics on Dhuum, and who
+took the most oils on Deimos:
+    python mechanics_query.py logs --boss Dhuum --type failed --group account --top 5
+    python mechanics_query.py logs --boss Deimos --mechanic oil --top 1
+"""
+
+import argparse
+import heapq
+import sys
+
+from mechanics_log import (LOG_ERRORS, expand_logs, open_session,
+                           process_batch)
+from log_cache import LogCache
+from Unicode_table import make_table
+
+# columns of the results
+COLUMNS = ["account", "boss", "mechanic", "type", "count", "pulls",
+           "per pull"]
+# grouping -> columns identifying a result
+GROUPS = {
+    "mechanic": ("account", "boss", "mechanic", "type"),
+    "boss": ("account", "boss"),
+    "account": ("account",),
+    }
+
+def iter_counts(session, boss=None, account=None, mechanic=None, kind=None):
+    """
+    Yield the counts of a session matching some filters
+
+    boss is a boss name, account and mechanic are parts of an account or
+    mechanic name, and kind is "failed" or "neutral". Case is ignored.
+    Yield (account, boss, mechanic, type, count, pulls) tuples, pulls being
+    the number of attempts of that account on that boss
+    """
+    boss = boss and boss.lower()
+    account = account and account.lower()
+    mechanic = mechanic and mechanic.lower()
+    for boss_name, record in session.records.items():
+        if boss and boss_name.lower() != boss:
+            continue
+        mechanics = []
+        for m_kind, m_names in (("failed", record.mechanics_f),
+                                ("neutral", record.mechanics_n)):
+            if kind and kind != m_kind:
+                continue
+            mechanics.extend((m_name, m_kind) for m_name in m_names
+                             if not mechanic or mechanic in m_name.lower())
+        if not mechanics:
+            continue
+        for account_name, counts in record.players.items():
+            if account and account not in account_name.lower():
+                continue
+            pulls = counts.get("Pulls") or 0
+            for m_name, m_kind in mechanics:
+                if m_name in counts:
+                    yield (account_name, boss_name, m_name, m_kind,
+                           counts[m_name], pulls)
+
+def run_query(session, boss=None, account=None, mechanic=None, kind=None,
+              group="mechanic", min_count=0, sort="count", top=None,
+              ascending=False):
+    """
+    Return the results of a query, as a list of dicts keyed by COLUMNS
+
+    See iter_counts for the filters. The counts are summed by group (see
+    GROUPS), the pulls being counted once per boss. Results below min_count
+    are dropped, the others are sorted by the sort column, highest first
+    unless ascending is True, and only the top first ones are kept if top is
+    given. The columns that are not part of the group are None
+    """
+    if group not in GROUPS:
+        raise ValueError("unknown group {}".format(group))
+    if sort not in COLUMNS:
+        raise ValueError("unknown column {}".format(sort))
+    key_columns = GROUPS[group]
+    key_indices = [COLUMNS.index(column) for column in key_columns]
+    # group key -> count, pulls and the bosses whose pulls were added
+    groups = {}
+    for item in iter_counts(session, boss, account, mechanic, kind):
+        key = tuple(item[i] for i in key_indices)
+        if key not in groups:
+            groups[key] = [0, 0, set()]
+        result = groups[key]
+        result[0] += item[4]
+        if item[1] not in result[2]:
+            result[2].add(item[1])
+            result[1] += item[5]
+    def results():
+        for key, (count, pulls, _) in groups.items():
+            if count < min_count:
+                continue
+            result = dict.fromkeys(COLUMNS)
+            result.update(zip(key_columns, key))
+            result["count"] = count
+            result["pulls"] = pulls
+            result["per pull"] = count / pulls if pulls else 0
+            yield result
+    def sort_key(result):
+        # columns outside of the group are None, sorted as empty strings
+        value = result[sort]
+        return "" if value is None else value
+    if top is None:
+        return sorted(results(), key=sort_key, reverse=not ascending)
+    if ascending:
+        return heapq.nsmallest(top, results(), key=sort_key)
+    return heapq.nlargest(top, results(), key=sort_key)
+
+def render_results(results, group="mechanic"):
+    """
+    Return the results of a query as a table made Unicode box characters
+    """
+    columns = list(GROUPS[group]) + ["count", "pulls", "per pull"]
+    data = [[column.capitalize() for column in columns]]
+    for result in results:
+        row = []
+        for column in columns:
+            value = result[column]
+            if column == "account":
+                value = value.strip(":")
+            elif column == "per pull":
+                value = "{:.2f}".format(value)
+            row.append(value)
+        data.append(row)
+    v_lines = "0" + "1" * (len(GROUPS[group]) - 1) + "2" + "11" + "0"
+    h_lines = "02" + "0" * (len(data) - 1)
+    return make_table(data, v_lines, h_lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Query the mechanics of one or many logs")
+    parser.add_argument("logs", nargs="+",
+        help="logs, directories of logs or glob patterns")
+    parser.add_argument("--boss", help="only count that boss")
+    parser.add_argument("--account",
+        help="only count the accounts containing that text")
+    parser.add_argument("--mechanic",
+        help="only count the mechanics containing that text")
+    parser.add_argument("--type", choices=["failed", "neutral"],
+        help="only count failed or neutral mechanics")
+    parser.add_argument("--group", choices=list(GROUPS), default="mechanic",
+        help="sum the counts by account, by account and boss, or keep a " +
+        "line per mechanic (default: %(default)s)")
+    parser.add_argument("--min-count", type=int, default=0,
+        help="only show the results counted at least that many times")
+    parser.add_argument("--sort", choices=COLUMNS, default="count",
+        help="column used to sort the results (default: %(default)s)")
+    parser.add_argument("--ascending", action="store_true",
+        help="show the lowest values first")
+    parser.add_argument("--top", type=int,
+        help="only show the first TOP results")
+    parser.add_argument("--workers", type=int,
+        help="number of processes used to parse the logs " +
+        "(default: one per core)")
+    args = parser.parse_args()
+
+    names = expand_logs(args.logs)
+    if len(names) == 1:
+        # a single log is read directly, without starting processes
+        try:
+            session, failed = open_session(names[0], LogCache()), []
+        except LOG_ERRORS:
+            print("{} could not be read".format(names[0]))
+            sys.exit(1)
+    else:
+        session, failed = process_batch(names, args.workers)
+    for name in failed:
+        print("{} could not be read".format(name))
+    results = run_query(session, args.boss, args.account, args.mechanic,
+                        args.type, args.group, args.min_count, args.sort,
+                        args.top, args.ascending)
+    if results:
+        print(render_results(results, args.group))
+    else:
+        print("No result")
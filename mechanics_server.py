@@ -0,0 +1,331 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Serve the mechanics tables of a log directory over HTTP
+
+Officers and bots asking for "the table of the last boss" don't have to run
+the script again: this long running server parses each log once (through the
+log cache) and renders the tables of all its bosses in every format of
+FORMATS, then keeps them in memory, already encoded. Once a table has been
+rendered, a request for it costs an os.stat of the log and a few dictionary
+lookups. A log is parsed and rendered again as soon as its size or
+modification time changes, and the directory is scanned for a new latest log
+at most once per second.
+    python mechanics_server.py <log directory> [--port 8000]
+
+GET /logs
+    valid logs of the directory, oldest first, as JSON
+GET /bosses?log=<file name>
+    bosses of a log, in the order they were fought, as JSON
+GET /table/<boss>?log=<file name>&format=<format>&page=<n>&max_chars=<n>
+    table of a boss, in one of the FORMATS (unicode by default). With page,
+    only that page of the unicode table split in Discord messages of at most
+    max_chars characters (2000 by default), the number of pages being given
+    by the X-Pages header. The boss name "last" is the last boss of the log.
+The log is the latest one of the directory unless given.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from mechanics_log import (DISCORD_LIMIT, FORMATS, LOG_ERRORS, LogCatalog,
+                           get_log_directory, open_session, table_pages)
+from log_cache import LogCache
+
+# content type of each output format
+CONTENT_TYPES = {
+    "unicode": "text/plain; charset=utf-8",
+    "json": "application/json; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "markdown": "text/markdown; charset=utf-8",
+    }
+
+class ServedLog:
+    """
+    A parsed log and its rendered tables, encoded in UTF-8
+
+    key is the size and modification time of the log when it was parsed.
+    Tables are rendered on first use and kept, warm renders all of them
+    """
+    def __init__(self, path, session, key):
+        self.path = path
+        self.session = session
+        self.key = key
+        # bosses in the order they were fought, and by lowercase name
+        self.bosses = list(session.records)
+        self.names = {boss_name.lower(): boss_name
+                      for boss_name in self.bosses}
+        if self.bosses:
+            self.names["last"] = self.bosses[-1]
+        # boss name -> BossTable
+        self._boss_tables = {}
+        # (boss name, format) -> table
+        self._tables = {}
+        # (boss name, max_chars) -> list of pages
+        self._pages = {}
+
+    def boss_table(self, boss_name):
+        """
+        Return the BossTable of a boss, building it if needed
+        """
+        table = self._boss_tables.get(boss_name)
+        if table is None:
+            table = self._boss_tables[boss_name] = \
+                self.session.boss_table(boss_name)
+        return table
+
+    def table(self, boss_name, fmt):
+        """
+        Return the table of a boss in a given format, rendering it if needed
+        """
+        text = self._tables.get((boss_name, fmt))
+        if text is None:
+            text = self._tables[boss_name, fmt] = \
+                FORMATS[fmt][1](self.boss_table(boss_name)).encode("utf-8")
+        return text
+
+    def pages(self, boss_name, max_chars=DISCORD_LIMIT):
+        """
+        Return the unicode table of a boss split in Discord messages
+
+        Raise a ValueError if max_chars is too small, see table_pages
+        """
+        pages = self._pages.get((boss_name, max_chars))
+        if pages is None:
+            pages = self._pages[boss_name, max_chars] = [
+                page.encode("utf-8") for page in
+                table_pages(self.boss_table(boss_name), max_chars)]
+        return pages
+
+    def warm(self):
+        """
+        Render the tables of every boss, in every format, and their pages
+        """
+        for boss_name in self.bosses:
+            for fmt in FORMATS:
+                self.table(boss_name, fmt)
+            self.pages(boss_name)
+        return self
+
+class TableStore:
+    """
+    Parsed logs of a directory and their tables, kept in memory
+
+    At most max_logs logs are kept, the first ones parsed being dropped
+    first. Answers don't wait for a lock once a log is rendered: only the
+    scans of the directory and the parsing are serialized
+    """
+    def __init__(self, directory, cache=None, max_logs=8, rescan=1):
+        self.directory = directory
+        self.cache = cache
+        self.max_logs = max_logs
+        self.rescan = rescan
+        self.catalog = LogCatalog(directory, cache)
+        # file name of the latest log, and time.monotonic() of its search
+        self._latest = None
+        self._scanned = None
+        # file name -> ServedLog
+        self._logs = {}
+        self._scan_lock = threading.Lock()
+        self._parse_lock = threading.Lock()
+
+    def _scan(self):
+        """
+        Look for the latest log, unless it was done less than rescan ago
+        """
+        if self._scanned is not None and \
+                time.monotonic() - self._scanned < self.rescan:
+            return
+        with self._scan_lock:
+            if self._scanned is None or \
+                    time.monotonic() - self._scanned >= self.rescan:
+                self._latest = self.catalog.update().latest()
+                self._scanned = time.monotonic()
+
+    def logs(self):
+        """
+        Return the names of the valid logs of the directory, oldest first
+        """
+        with self._scan_lock:
+            self._latest = self.catalog.update().latest()
+            self._scanned = time.monotonic()
+            return self.catalog.logs()
+
+    def get(self, name=None):
+        """
+        Return the ServedLog of a log of the directory, the latest one by
+        default, parsing and rendering it if it isn't up to date
+
+        Raise a KeyError if there is no such log. Errors reading the log are
+        raised as by open_session
+        """
+        if name is None:
+            self._scan()
+            name = self._latest
+            if name is None:
+                raise KeyError("no log")
+        elif os.path.basename(name) != name or \
+                not name.lower().endswith(".csv"):
+            raise KeyError(name)
+        path = os.path.join(self.directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise KeyError(name) from None
+        key = (stat.st_size, stat.st_mtime_ns)
+        log = self._logs.get(name)
+        if log is not None and log.key == key:
+            return log
+        with self._parse_lock:
+            # another request may have parsed it in the meantime
+            log = self._logs.get(name)
+            if log is None or log.key != key:
+                log = ServedLog(path, open_session(path, self.cache),
+                                key).warm()
+                self._logs.pop(name, None)
+                self._logs[name] = log
+                while len(self._logs) > self.max_logs:
+                    del self._logs[next(iter(self._logs))]
+        return log
+
+class TableHandler(BaseHTTPRequestHandler):
+    """
+    Answer the requests of the server, see the description of the module
+    """
+    # connections are kept open, so a bot doesn't connect for each table
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are written separately: without TCP_NODELAY,
+    # each answer would wait for the delayed acknowledgement of the client
+    disable_nagle_algorithm = True
+    server_version = "MechanicsLogServer"
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = {key: values[-1]
+                 for key, values in parse_qs(parts.query).items()}
+        path = parts.path.rstrip("/")
+        store = self.server.store
+        try:
+            if path == "/logs":
+                return self.send_json(store.logs())
+            log = store.get(query.get("log"))
+            if path == "/bosses":
+                return self.send_json(log.bosses)
+            if not path.startswith("/table/"):
+                return self.send_text(404, "Unknown page")
+            boss_name = log.names.get(unquote(path[7:]).lower())
+            if boss_name is None:
+                return self.send_text(404, "No such boss in {}".format(
+                    os.path.basename(log.path)))
+            fmt = query.get("format", "unicode")
+            if fmt not in FORMATS:
+                return self.send_text(400, "Unknown format, use one of " +
+                                      ", ".join(FORMATS))
+            if "page" not in query:
+                return self.send(200, log.table(boss_name, fmt),
+                                 CONTENT_TYPES[fmt])
+            if fmt != "unicode":
+                return self.send_text(400, "Only unicode tables have pages")
+            try:
+                page = int(query["page"])
+                max_chars = int(query.get("max_chars", DISCORD_LIMIT))
+                if max_chars <= 0:
+                    raise ValueError
+            except ValueError:
+                return self.send_text(400, "page and max_chars must be " +
+                                      "positive numbers")
+            try:
+                pages = log.pages(boss_name, max_chars)
+            except ValueError as e:
+                return self.send_text(400, str(e))
+            if not 1 <= page <= len(pages):
+                return self.send_text(404, "No such page")
+            return self.send(200, pages[page - 1], CONTENT_TYPES[fmt],
+                             {"X-Pages": len(pages)})
+        except KeyError:
+            return self.send_text(404, "No such log")
+        except LOG_ERRORS:
+            return self.send_text(500, "The log could not be read")
+
+    def send(self, status, body, content_type, headers=None):
+        """
+        Send an answer, body being bytes
+        """
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_text(self, status, text):
+        """
+        Send a plain text answer
+        """
+        self.send(status, (text + "\n").encode("utf-8"),
+                  CONTENT_TYPES["unicode"])
+
+    def send_json(self, data):
+        """
+        Send data as JSON
+        """
+        self.send(200, json.dumps(data, ensure_ascii=False).encode("utf-8"),
+                  CONTENT_TYPES["json"])
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def make_server(directory, host="127.0.0.1", port=8000, cache=None,
+                verbose=False):
+    """
+    Return an HTTP server for the tables of the logs of a directory
+
+    Each request is answered in its own thread. The server isn't started
+    """
+    server = ThreadingHTTPServer((host, port), TableHandler)
+    server.daemon_threads = True
+    server.store = TableStore(directory, cache)
+    server.verbose = verbose
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve the mechanics tables of a log directory")
+    parser.add_argument("directory", nargs="?",
+        help="directory of the logs (default: the one of " +
+        "mechanics_log_settings.ini)")
+    parser.add_argument("--host", default="127.0.0.1",
+        help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8000,
+        help="port to listen on (default: %(default)s)")
+    parser.add_argument("--verbose", action="store_true",
+        help="print every request")
+    args = parser.parse_args()
+
+    directory = args.directory or get_log_directory()
+    if not os.path.isdir(directory):
+        print("{} is not a directory".format(directory))
+        sys.exit(1)
+    server = make_server(directory, args.host, args.port, LogCache(),
+                         args.verbose)
+    # the latest log is rendered before the first request
+    try:
+        server.store.get()
+    except (KeyError,) + LOG_ERRORS:
+        pass
+    print("Serving the tables of {} on http://{}:{}/\nHit Ctrl+C to stop"
+          .format(directory, args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
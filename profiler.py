@@ -0,0 +1,194 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Lightweight measurement of the stages of the script
+
+The code marks its stages with the stage context manager:
+    with stage("parse") as s:
+        ...
+        s.rows = n_rows
+Nothing is measured until enable is called: a disabled stage costs a function
+call and returns a shared object that does nothing.
+Once enabled, each stage records its number of calls, its wall time, the rows
+it handled and its memory peak, measured with tracemalloc. Stages can be
+nested, and run by several threads, each one with its own nesting. As
+tracemalloc measures the whole process, the peak of stages running at the
+same time in different threads includes the memory of both.
+Optionally, the top level stages are run under cProfile, and the profile of
+the slowest one can be saved.
+"""
+
+import time
+
+# modules only imported by enable, as measurements are rarely enabled and
+# importing them would slow down every import of the script
+cProfile = None
+tracemalloc = None
+_enabled = False
+_cprofile = False
+# thread local data holding the stages being measured, and lock of the
+# results. Only created by enable
+_local = None
+_lock = None
+# stage name -> calls, time, rows and peak memory
+results = {}
+# duration, name and profile of the slowest top level stage
+_slowest = None
+
+class _NullStage:
+    """
+    Stage used when measurements are disabled
+    """
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    """
+    Stage being measured
+    """
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.profile = None
+
+    def __enter__(self):
+        # the peak is reset for this stage. The one reached before is kept so
+        # that the enclosing stage still gets it
+        self.outer_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        self.inner_peak = 0
+        self.stack = _stack()
+        if _cprofile and not self.stack:
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                # a single profiler can run at a time since Python 3.12: the
+                # stage of another thread is already profiled
+                self.profile = None
+        self.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _slowest
+        duration = time.perf_counter() - self.start
+        stack = self.stack
+        stack.pop()
+        if self.profile is not None:
+            self.profile.disable()
+        peak = max(self.inner_peak, tracemalloc.get_traced_memory()[1])
+        if stack:
+            stack[-1].inner_peak = max(stack[-1].inner_peak,
+                                       self.outer_peak, peak)
+        with _lock:
+            if self.profile is not None and \
+                    (_slowest is None or duration > _slowest[0]):
+                _slowest = (duration, self.name, self.profile)
+            result = results.setdefault(self.name, {
+                "calls": 0, "time": 0, "rows": None, "peak_mb": 0})
+            result["calls"] += 1
+            result["time"] += duration
+            if self.rows is not None:
+                result["rows"] = (result["rows"] or 0) + self.rows
+            result["peak_mb"] = max(result["peak_mb"], peak / 1e6)
+        return False
+
+def _stack():
+    """
+    Return the stages being measured by the current thread, innermost last
+    """
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def stage(name, rows=None):
+    """
+    Return a context manager measuring a stage of the script
+
+    rows is the number of rows handled by the stage. It can also be set on
+    the returned object before the stage ends
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, rows)
+
+def enable(cprofile=False):
+    """
+    Start measuring the stages
+
+    If cprofile is True, the top level stages are also profiled
+    """
+    global _enabled, _cprofile, _local, _lock, cProfile, tracemalloc
+    import cProfile
+    import threading
+    import tracemalloc
+    if _local is None:
+        _local, _lock = threading.local(), threading.Lock()
+    _enabled, _cprofile = True, cprofile
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def report():
+    """
+    Return the measurements as a table, slowest stages first
+    """
+    if not results:
+        return "No stage was measured"
+    from Unicode_table import make_table
+    data = [["Stage", "Calls", "Time (s)", "Rows", "Peak (MB)"]]
+    for name, result in sorted(results.items(),
+                               key=lambda item: -item[1]["time"]):
+        data.append([name, result["calls"], "{:.3f}".format(result["time"]),
+                     "" if result["rows"] is None else result["rows"],
+                     "{:.1f}".format(result["peak_mb"])])
+    return make_table(data, "121111", "12" + "0" * (len(data) - 2) + "1")
+
+def save_json(name):
+    """
+    Save the measurements as JSON
+    """
+    import json
+    with open(name, "w") as f:
+        json.dump(results, f, indent=4)
+
+def save_slowest_profile(name):
+    """
+    Save the cProfile statistics of the slowest top level stage
+
+    Return the name of that stage, or None if nothing was profiled
+    """
+    if _slowest is None:
+        return None
+    _slowest[2].dump_stats(name)
+    return _slowest[1]
+
+def print_report(json_name=None, profile_name=None):
+    """
+    Print the measurements, and save them if file names are given
+    """
+    if not _enabled:
+        return
+    if not results:
+        print("\nNo stage was measured")
+        return
+    print("\nTime and memory of each stage (times include the cost of " +
+          "tracemalloc):")
+    print(report())
+    if json_name:
+        save_json(json_name)
+        print("Measurements saved to {}".format(json_name))
+    if profile_name:
+        name = save_slowest_profile(profile_name)
+        if name is not None:
+            print("Profile of the slowest stage ({}) saved to {}".format(
+                name, profile_name))
@@ -0,0 +1,229 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Check the webhook publisher against a stub of the Discord webhook
+
+The stub is an HTTP server on a free local port, answering each message with
+the next answer of its script (a successful post once the script is over),
+and recording the messages it received and the connection they came from.
+    python -m unittest test_discord_webhook
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from discord_webhook import (WebhookError, WebhookPublisher, log_messages,
+                             message_size, publish_logs)
+from log_generator import generate_log
+from mechanics_log import open_session
+
+# answers of the stub: (status, headers, body), or one of these
+CHUNKED = "chunked"
+DROP = "drop"
+CLOSE = "close"
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answer a message with the next answer of the script of the server
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with server.lock:
+            server.received.append((self.client_address,
+                                    json.loads(body)["content"]))
+            n = len(server.received)
+            answer = server.script.pop(0) if server.script else None
+        if answer == DROP:
+            # the message was received, but the connection is lost
+            self.close_connection = True
+            return
+        if answer == CHUNKED:
+            data = json.dumps({"id": n}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in (data[:3], data[3:]):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        if answer in (None, CLOSE):
+            status, headers, data = 200, {}, json.dumps({"id": n}).encode()
+            if answer == CLOSE:
+                headers["Connection"] = "close"
+                self.close_connection = True
+        else:
+            status, headers, data = answer
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubTestCase(unittest.TestCase):
+    """
+    Test case starting a stub of the webhook for each test
+    """
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.script = []
+        self.server.received = []
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.url = "http://127.0.0.1:{}/api/webhooks/1/token".format(
+            self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def publish(self, messages, **options):
+        """
+        Publish messages to the stub, and return the publisher
+        """
+        async def run():
+            async with WebhookPublisher(self.url, backoff=0.01,
+                                        **options) as publisher:
+                await publisher.publish(messages)
+            return publisher
+        return asyncio.run(run())
+
+    def contents(self):
+        return [content for address, content in self.server.received]
+
+class WebhookPublisherTest(StubTestCase):
+    def test_single_connection(self):
+        publisher = self.publish(["a", "b", "c"])
+        self.assertEqual(publisher.posted, 3)
+        self.assertEqual(self.contents(), ["a", "b", "c"])
+        self.assertEqual(len({address for address, content
+                              in self.server.received}), 1)
+
+    def test_closed_connection_is_opened_again(self):
+        self.server.script = [CLOSE]
+        publisher = self.publish(["a", "b"])
+        self.assertEqual(publisher.posted, 2)
+        self.assertEqual(self.contents(), ["a", "b"])
+        self.assertEqual(len({address for address, content
+                              in self.server.received}), 2)
+
+    def test_rate_limited(self):
+        self.server.script = [(429, {"Retry-After": "0.2"},
+                               b'{"retry_after": 0.2}')]
+        start = time.monotonic()
+        publisher = self.publish(["a", "b"])
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(publisher.posted, 2)
+        self.assertEqual(self.contents(), ["a", "a", "b"])
+
+    def test_server_error_is_retried(self):
+        self.server.script = [(502, {}, b"Bad Gateway"),
+                              (502, {}, b"Bad Gateway")]
+        publisher = self.publish(["a", "b"])
+        self.assertEqual(publisher.posted, 2)
+        self.assertEqual(self.contents(), ["a", "a", "a", "b"])
+
+    def test_too_many_server_errors(self):
+        self.server.script = [(502, {}, b"Bad Gateway")] * 3
+        with self.assertRaises(WebhookError) as context:
+            self.publish(["a", "b"], max_retries=2)
+        self.assertEqual(context.exception.posted, 0)
+        self.assertEqual(self.contents(), ["a", "a", "a"])
+
+    def test_client_error_is_not_retried(self):
+        self.server.script = [(400, {}, b'{"message": "Cannot send"}')]
+        with self.assertRaises(WebhookError):
+            self.publish(["a", "b"])
+        self.assertEqual(self.contents(), ["a"])
+
+    def test_chunked_body(self):
+        self.server.script = [CHUNKED]
+
+        async def run():
+            async with WebhookPublisher(self.url) as publisher:
+                return await publisher.post("a"), await publisher.post("b")
+        self.assertEqual(asyncio.run(run()), ({"id": 1}, {"id": 2}))
+        self.assertEqual(len({address for address, content
+                              in self.server.received}), 1)
+
+    def test_dropped_connection_is_not_posted_twice(self):
+        self.server.script = [None, DROP]
+        with self.assertRaises(WebhookError) as context:
+            self.publish(["a", "b", "c"])
+        self.assertEqual(context.exception.posted, 1)
+        self.assertEqual(self.contents(), ["a", "b"])
+
+    def test_refused_connection_is_retried(self):
+        # a port nothing listens on
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        async def run():
+            async with WebhookPublisher("http://127.0.0.1:{}/".format(port),
+                                        max_retries=2, backoff=0.01) as p:
+                await p.post("a")
+        with self.assertRaises(WebhookError) as context:
+            asyncio.run(run())
+        self.assertIn("connection failed", str(context.exception))
+        self.assertEqual(context.exception.posted, 0)
+
+class PublishLogsTest(StubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        # the table of the first log is narrow, the one of the second too
+        # wide for messages of 150 characters
+        self.logs = []
+        for name, mechanics in (("narrow.csv", 2), ("wide.csv", 40)):
+            self.logs.append(os.path.join(self.directory.name, name))
+            with open(self.logs[-1], "w", newline="") as f:
+                generate_log(f, players=3, bosses=1, mechanics=mechanics)
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    def test_pages_are_posted_in_order(self):
+        posted, failed = asyncio.run(publish_logs(
+            self.url, self.logs[:1] + ["missing.csv"], max_chars=150))
+        messages = log_messages(open_session(self.logs[0]), max_chars=150)
+        self.assertGreater(len(messages), 1)
+        self.assertEqual(failed, ["missing.csv"])
+        self.assertEqual(posted, len(messages))
+        self.assertEqual(self.contents(), messages)
+        for content in self.contents():
+            self.assertLessEqual(len(content), 150)
+
+    def test_nothing_posted_if_a_table_doesnt_fit(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(publish_logs(self.url, self.logs, max_chars=150))
+        self.assertEqual(self.server.received, [])
+
+    def test_message_size(self):
+        self.assertEqual(message_size("150"), 150)
+        self.assertEqual(message_size("2000"), 2000)
+        for text in ("0", "-1", "2001"):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                message_size(text)
+
+if __name__ == "__main__":
+    unittest.main()
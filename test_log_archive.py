@@ -0,0 +1,108 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Check the import, extraction and compaction of the log archives
+
+Logs are written by log_generator in a temporary directory.
+    python -m unittest test_log_archive
+"""
+
+import os
+import tempfile
+import unittest
+
+from log_archive import LogArchive, import_logs
+from log_generator import generate_log
+
+class LogArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive_path = self.path("season.mla")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, *names):
+        return os.path.join(self.directory.name, *names)
+
+    def write_log(self, name, seed=0, mtime=None):
+        """
+        Write a log in the temporary directory, and return its path
+        """
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", newline="") as f:
+            generate_log(f, players=5, bosses=2, pulls=3, seed=seed)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_import_nothing(self):
+        archive = LogArchive(self.archive_path)
+        self.assertEqual(import_logs(archive, []), (0, [], []))
+        self.assertFalse(os.path.exists(self.archive_path))
+
+    def test_import_no_valid_log(self):
+        name = self.path("notes.csv")
+        with open(name, "w") as f:
+            f.write("not a mechanics log\n")
+        archive = LogArchive(self.archive_path)
+        self.assertEqual(import_logs(archive, [name]), (0, [name], []))
+        self.assertFalse(os.path.exists(self.archive_path))
+
+    def test_extract(self):
+        name = self.write_log("a.csv", mtime=1557256212)
+        import_logs(LogArchive(self.archive_path), [name])
+        archive = LogArchive(self.archive_path)
+        archive.extract("a.csv", self.path("extracted.csv"))
+        self.assertEqual(self.read(self.path("extracted.csv")),
+                         self.read(name))
+        self.assertEqual(os.stat(self.path("extracted.csv")).st_mtime_ns,
+                         os.stat(name).st_mtime_ns)
+
+    def test_import_again(self):
+        names = [self.write_log("a.csv"), self.write_log("b.csv", seed=1)]
+        archive = LogArchive(self.archive_path)
+        self.assertEqual(import_logs(archive, names), (2, [], []))
+        self.assertEqual(import_logs(archive, names), (0, [], []))
+
+    def test_compact(self):
+        name = self.write_log("a.csv", mtime=1557256212)
+        other = self.write_log("b.csv", seed=1)
+        import_logs(LogArchive(self.archive_path), [name, other])
+        # the log is exported again: its first version is left unused
+        self.write_log("a.csv", seed=2, mtime=1557259812)
+        archive = LogArchive(self.archive_path)
+        archive.add(name)
+        archive.save()
+        unused = archive.unused_bytes()
+        self.assertGreater(unused, 0)
+        self.assertGreater(archive.compact(), 0)
+        self.assertLess(archive.unused_bytes(), unused)
+        archive = LogArchive(self.archive_path)
+        for log_name, path in (("a.csv", name), ("b.csv", other)):
+            archive.extract(log_name, self.path("extracted.csv"))
+            self.assertEqual(self.read(self.path("extracted.csv")),
+                             self.read(path))
+        self.assertFalse([entry for entry in os.listdir(self.directory.name)
+                          if entry.endswith(".tmp")])
+
+    def test_name_collision(self):
+        name = self.write_log(os.path.join("night 1", "a.csv"))
+        copy = self.write_log(os.path.join("copy", "a.csv"), mtime=0)
+        other = self.write_log(os.path.join("night 2", "a.csv"), seed=1)
+        archive = LogArchive(self.archive_path)
+        self.assertEqual(import_logs(archive, [name]), (1, [], []))
+        # the same log, copied elsewhere, is already archived
+        self.assertEqual(import_logs(archive, [copy]), (0, [], []))
+        self.assertEqual(import_logs(archive, [other]), (0, [], [other]))
+        self.assertEqual(LogArchive(self.archive_path).logs["a.csv"]["path"],
+                         os.path.abspath(name))
+
+if __name__ == "__main__":
+    unittest.main()
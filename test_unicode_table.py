@@ -0,0 +1,134 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Check that legs_to_unicode returns what the original nested ifs returned
+
+EXPECTED was written from the first version of legs_to_unicode, which tested
+the legs and dotted one by one: for each (r, b, l, t), the characters given
+for dotted = 0, 1, 2 and 3. Every combination is checked, including the ones
+for which no character was returned.
+    python -m unittest test_unicode_table
+"""
+
+import itertools
+import unittest
+
+from Unicode_table import legs_to_unicode
+
+# (r, b, l, t) -> characters returned for dotted = 0, 1, 2, 3
+EXPECTED = {
+    (0, 0, 0, 0): "\u0020\u0020\u0020\u0020",
+    (0, 0, 0, 1): "\u2575\u2575\u2575\u2575",
+    (0, 0, 0, 2): "\u2579\u2579\u2579\u2579",
+    (0, 0, 1, 0): "\u2574\u2574\u2574\u2574",
+    (0, 0, 1, 1): "\u2518\u2518\u2518\u2518",
+    (0, 0, 1, 2): "\u251a\u251a\u251a\u251a",
+    (0, 0, 2, 0): "\u2578\u2578\u2578\u2578",
+    (0, 0, 2, 1): "\u2519\u2519\u2519\u2519",
+    (0, 0, 2, 2): "\u251b\u251b\u251b\u251b",
+    (0, 1, 0, 0): "\u2577\u2577\u2577\u2577",
+    (0, 1, 0, 1): "\u2502\u254e\u2506\u250a",
+    (0, 1, 0, 2): "\u257f\u257f\u257f\u257f",
+    (0, 1, 1, 0): "\u2510\u2510\u2510\u2510",
+    (0, 1, 1, 1): "\u2524\u2524\u2524\u2524",
+    (0, 1, 1, 2): "\u2526\u2526\u2526\u2526",
+    (0, 1, 2, 0): "\u2511\u2511\u2511\u2511",
+    (0, 1, 2, 1): "\u2525\u2525\u2525\u2525",
+    (0, 1, 2, 2): "\u2529\u2529\u2529\u2529",
+    (0, 2, 0, 0): "\u257b\u257b\u257b\u257b",
+    (0, 2, 0, 1): "\u257d\u257d\u257d\u257d",
+    (0, 2, 0, 2): "\u2503\u254f\u2507\u250b",
+    (0, 2, 1, 0): "\u2512\u2512\u2512\u2512",
+    (0, 2, 1, 1): "\u2527\u2527\u2527\u2527",
+    (0, 2, 1, 2): "\u2528\u2528\u2528\u2528",
+    (0, 2, 2, 0): "\u2513\u2513\u2513\u2513",
+    (0, 2, 2, 1): "\u252a\u252a\u252a\u252a",
+    (0, 2, 2, 2): "\u252b\u252b\u252b\u252b",
+    (1, 0, 0, 0): "\u2576\u2576\u2576\u2576",
+    (1, 0, 0, 1): "\u2514\u2514\u2514\u2514",
+    (1, 0, 0, 2): "\u2516\u2516\u2516\u2516",
+    (1, 0, 1, 0): "\u2500\u254c\u2504\u2508",
+    (1, 0, 1, 1): "\u2534\u2534\u2534\u2534",
+    (1, 0, 1, 2): "\u2538\u2538\u2538\u2538",
+    (1, 0, 2, 0): "\u257e\u257e\u257e\u257e",
+    (1, 0, 2, 1): "\u2535\u2535\u2535\u2535",
+    (1, 0, 2, 2): "\u2539\u2539\u2539\u2539",
+    (1, 1, 0, 0): "\u250c\u250c\u250c\u250c",
+    (1, 1, 0, 1): "\u251c\u251c\u251c\u251c",
+    (1, 1, 0, 2): "\u251e\u251e\u251e\u251e",
+    (1, 1, 1, 0): "\u252c\u252c\u252c\u252c",
+    (1, 1, 1, 1): "\u253c\u253c\u253c\u253c",
+    (1, 1, 1, 2): "\u2540\u2540\u2540\u2540",
+    (1, 1, 2, 0): "\u252d\u252d\u252d\u252d",
+    (1, 1, 2, 1): "\u253d\u253d\u253d\u253d",
+    (1, 1, 2, 2): "\u2543\u2543\u2543\u2543",
+    (1, 2, 0, 0): "\u250e\u250e\u250e\u250e",
+    (1, 2, 0, 1): "\u251f\u251f\u251f\u251f",
+    (1, 2, 0, 2): "\u2520\u2520\u2520\u2520",
+    (1, 2, 1, 0): "\u2530\u2530\u2530\u2530",
+    (1, 2, 1, 1): "\u2541\u2541\u2541\u2541",
+    (1, 2, 1, 2): "\u2542\u2542\u2542\u2542",
+    (1, 2, 2, 0): "\u2531\u2531\u2531\u2531",
+    (1, 2, 2, 1): "\u2545\u2545\u2545\u2545",
+    (1, 2, 2, 2): "\u2549\u2549\u2549\u2549",
+    (2, 0, 0, 0): "\u257a\u257a\u257a\u257a",
+    (2, 0, 0, 1): "\u2515\u2515\u2515\u2515",
+    (2, 0, 0, 2): "\u2517\u2517\u2517\u2517",
+    (2, 0, 1, 0): "\u257c\u257c\u257c\u257c",
+    (2, 0, 1, 1): "\u2536\u2536\u2536\u2536",
+    (2, 0, 1, 2): "\u253a\u253a\u253a\u253a",
+    (2, 0, 2, 0): "\u2501\u254d\u2505\u2509",
+    (2, 0, 2, 1): "\u2537\u2537\u2537\u2537",
+    (2, 0, 2, 2): "\u253b\u253b\u253b\u253b",
+    (2, 1, 0, 0): "\u250d\u250d\u250d\u250d",
+    (2, 1, 0, 1): "\u251d\u251d\u251d\u251d",
+    (2, 1, 0, 2): "\u2521\u2521\u2521\u2521",
+    (2, 1, 1, 0): "\u252e\u252e\u252e\u252e",
+    (2, 1, 1, 1): "\u253e\u253e\u253e\u253e",
+    (2, 1, 1, 2): "\u2544\u2544\u2544\u2544",
+    (2, 1, 2, 0): "\u252f\u252f\u252f\u252f",
+    (2, 1, 2, 1): "\u253f\u253f\u253f\u253f",
+    (2, 1, 2, 2): "\u2547\u2547\u2547\u2547",
+    (2, 2, 0, 0): "\u250f\u250f\u250f\u250f",
+    (2, 2, 0, 1): "\u2522\u2522\u2522\u2522",
+    (2, 2, 0, 2): "\u2523\u2523\u2523\u2523",
+    (2, 2, 1, 0): "\u2532\u2532\u2532\u2532",
+    (2, 2, 1, 1): "\u2546\u2546\u2546\u2546",
+    (2, 2, 1, 2): "\u254a\u254a\u254a\u254a",
+    (2, 2, 2, 0): "\u2533\u2533\u2533\u2533",
+    (2, 2, 2, 1): "\u2548\u2548\u2548\u2548",
+    (2, 2, 2, 2): "\u254b\u254b\u254b\u254b",
+    }
+
+class LegsToUnicodeTest(unittest.TestCase):
+    def test_every_character(self):
+        for (r, b, l, t), chars in EXPECTED.items():
+            for dotted, char in enumerate(chars):
+                with self.subTest(legs=(r, b, l, t), dotted=dotted):
+                    self.assertEqual(legs_to_unicode(r, b, l, t, dotted), char)
+
+    def test_default_dotted(self):
+        for (r, b, l, t), chars in EXPECTED.items():
+            with self.subTest(legs=(r, b, l, t)):
+                self.assertEqual(legs_to_unicode(r, b, l, t), chars[0])
+
+    def test_dotted_out_of_range(self):
+        # straight lines had no character, the others ignored dotted
+        for (r, b, l, t), chars in EXPECTED.items():
+            for dotted in (-1, 4, 5):
+                with self.subTest(legs=(r, b, l, t), dotted=dotted):
+                    expected = None if len(set(chars)) > 1 else chars[0]
+                    self.assertEqual(legs_to_unicode(r, b, l, t, dotted),
+                                     expected)
+
+    def test_legs_out_of_range(self):
+        for legs in itertools.product(range(-1, 4), repeat=4):
+            if all(0 <= leg <= 2 for leg in legs):
+                continue
+            for dotted in range(-1, 5):
+                with self.subTest(legs=legs, dotted=dotted):
+                    self.assertIsNone(legs_to_unicode(*legs, dotted))
+
+if __name__ == "__main__":
+    unittest.main()